@@ -45,6 +45,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main_app.middleware.EntitlementMiddleware',
+    'main_app.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -88,6 +90,55 @@ if not DATABASES['default']:
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 
+# SQLite tuned for several gunicorn workers: WAL, busy timeout and BEGIN
+# IMMEDIATE (see main_app.backends.sqlite3; compare with benchmark_sqlite)
+if os.getenv('SQLITE_CONCURRENCY', 'False') == 'True' and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['ENGINE'] = 'main_app.backends.sqlite3'
+
+# Optional read replica for dashboards, reports and admin changelists (see
+# main_app.routers). Locally, point it at a copy of the SQLite file.
+if os.getenv('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.parse(os.getenv('DATABASE_REPLICA_URL'), conn_max_age=600)
+    # Tests run against one database; the replica alias reads it too
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['main_app.routers.ReplicaRouter']
+# How long a client's reads stay on the primary after it writes; cover the replication lag
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
+
+# Cache
+# Signal-driven invalidation only reaches other workers through a shared
+# backend, so set REDIS_URL whenever more than one process serves requests.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
+# Longest a worker serves its in-process copy of plans and emission factors
+# before reloading them, whether or not an invalidation reached it
+PROCESS_CACHE_MAX_AGE = int(os.getenv('PROCESS_CACHE_MAX_AGE', '60'))
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', '300'))
+# Upper bound for cached entitlements; entries also expire with the subscription
+ENTITLEMENT_CACHE_TIMEOUT = int(os.getenv('ENTITLEMENT_CACHE_TIMEOUT', '86400'))
+# Anonymous pricing page; plan changes invalidate it immediately
+PRICING_CACHE_TIMEOUT = int(os.getenv('PRICING_CACHE_TIMEOUT', '3600'))
+# Analytics series for closed periods; writes into those periods invalidate them
+ANALYTICS_CACHE_TIMEOUT = int(os.getenv('ANALYTICS_CACHE_TIMEOUT', '86400'))
+ADMIN_DATE_HIERARCHY_CACHE_TIMEOUT = int(os.getenv('ADMIN_DATE_HIERARCHY_CACHE_TIMEOUT', '600'))
+
+# Admin changelists over large tables: use the planner estimate (PostgreSQL)
+# or trigger-maintained counters (SQLite) instead of COUNT(*) when unfiltered.
+# The SQLite triggers are installed or dropped by the next migrate.
+ADMIN_APPROXIMATE_COUNTS = os.getenv('ADMIN_APPROXIMATE_COUNTS', 'False') == 'True'
+ADMIN_APPROXIMATE_COUNT_THRESHOLD = int(os.getenv('ADMIN_APPROXIMATE_COUNT_THRESHOLD', '10000'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -139,6 +190,25 @@ if not DEBUG:
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', '')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
+# Override to point the Stripe client at a local stub server
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', 'https://api.stripe.com')
+# Stripe HTTP client (main_app.stripe_client): per-call timeouts in seconds,
+# retries on connection errors, keep-alive pool size and circuit breaker
+STRIPE_CONNECT_TIMEOUT = float(os.getenv('STRIPE_CONNECT_TIMEOUT', '3.05'))
+STRIPE_READ_TIMEOUT = float(os.getenv('STRIPE_READ_TIMEOUT', '10'))
+STRIPE_MAX_NETWORK_RETRIES = int(os.getenv('STRIPE_MAX_NETWORK_RETRIES', '1'))
+STRIPE_POOL_SIZE = int(os.getenv('STRIPE_POOL_SIZE', '10'))
+STRIPE_BREAKER_THRESHOLD = int(os.getenv('STRIPE_BREAKER_THRESHOLD', '5'))
+STRIPE_BREAKER_COOLDOWN = int(os.getenv('STRIPE_BREAKER_COOLDOWN', '30'))
+
+# Email settings (goal reminders). Use the locmem backend to measure send throughput.
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'False') == 'True'
+DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'EcoTrack <noreply@ecotrack.local>')
 
 # Authentication settings
 LOGIN_REDIRECT_URL = 'main_app:dashboard'
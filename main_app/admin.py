@@ -1,10 +1,178 @@
+import hashlib
+
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db.models import Count, IntegerField, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from django.urls import reverse
-from .models import EcoActivity, SustainabilityGoal, SubscriptionPlan, UserSubscription
+from .models import (
+    EcoActivity, EmissionFactor, SustainabilityGoal, SubscriptionPlan, UserSubscription, Tag, StripeEvent,
+)
+from .rowcounts import estimate_row_count
+from . import reminders, search
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    Foreign key filter that searches through the admin autocomplete view.
+
+    Only the selected object is loaded, instead of one link per row of the
+    related table. The model admin must list the field in autocomplete_fields.
+    """
+    template = 'admin/main_app/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = f'{self.field_name}__id__exact'
+        self.field = model._meta.get_field(self.field_name)
+        self.admin_site = model_admin.admin_site
+        super().__init__(request, params, model, model_admin)
+
+    def lookups(self, request, model_admin):
+        return []
+
+    def has_output(self):
+        return True
+
+    def valid_value(self):
+        value = self.value()
+        return value if value and value.isdigit() else None
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        if self.valid_value() is None:
+            return queryset.none()
+        return queryset.filter(**{self.parameter_name: self.valid_value()})
+
+    def render_widget(self):
+        related_model = self.field.remote_field.model
+        choice_field = forms.ModelChoiceField(
+            queryset=related_model._default_manager.all(),
+            required=False,
+            widget=AutocompleteSelect(
+                self.field,
+                self.admin_site,
+                attrs={'data-filter-parameter': self.parameter_name, 'data-width': '100%'},
+            ),
+        )
+        return choice_field.widget.render(self.parameter_name, self.valid_value())
+
+    @classmethod
+    def media(cls, model, admin_site):
+        return AutocompleteSelect(model._meta.get_field(cls.field_name), admin_site).media
+
+
+class UserAutocompleteFilter(AutocompleteFilter):
+    title = 'user'
+    field_name = 'user'
+
+
+class CachedDatesQuerySetMixin:
+    """
+    Caches the Min/Max range and DISTINCT date scans that the admin date
+    hierarchy runs, keyed by the changelist's SQL. Other aggregates (e.g. from
+    actions handed this queryset) always run.
+    """
+
+    def _cached(self, name, compute):
+        try:
+            sql, params = self.query.sql_with_params()
+        except EmptyResultSet:
+            # .none(), e.g. from a filter given a value it can't match
+            return compute()
+        digest = hashlib.md5(f'{name}|{sql}|{params}'.encode()).hexdigest()
+        key = f'admin:dates:{self.model._meta.label_lower}:{digest}'
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.set(key, value, getattr(settings, 'ADMIN_DATE_HIERARCHY_CACHE_TIMEOUT', 600))
+        return value
+
+    def dates(self, field_name, kind, order='ASC'):
+        return self._cached(
+            f'dates:{field_name}:{kind}:{order}',
+            lambda: list(super(CachedDatesQuerySetMixin, self).dates(field_name, kind, order)),
+        )
+
+    def aggregate(self, *args, **kwargs):
+        if args or not kwargs or not all(isinstance(value, (Min, Max)) for value in kwargs.values()):
+            return super(CachedDatesQuerySetMixin, self).aggregate(*args, **kwargs)
+        return self._cached(
+            f'aggregate:{args}:{kwargs}',
+            lambda: super(CachedDatesQuerySetMixin, self).aggregate(*args, **kwargs),
+        )
+
+
+_cached_dates_classes = {}
+
+
+def with_cached_dates(queryset):
+    """Return a clone of queryset whose dates() and aggregate() results are cached"""
+    base = type(queryset)
+    if base not in _cached_dates_classes:
+        _cached_dates_classes[base] = type(f'CachedDates{base.__name__}', (CachedDatesQuerySetMixin, base), {})
+    clone = queryset._chain()
+    clone.__class__ = _cached_dates_classes[base]
+    return clone
+
+
+class CachedDateHierarchyChangeList(ChangeList):
+    def get_queryset(self, request):
+        return with_cached_dates(super().get_queryset(request))
+
+
+def approximate_counts_enabled():
+    return getattr(settings, 'ADMIN_APPROXIMATE_COUNTS', False)
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Uses the database's row estimate instead of COUNT(*) for unfiltered
+    changelists over large tables. Filtered lists, and tables below
+    ADMIN_APPROXIMATE_COUNT_THRESHOLD rows, still get an exact count.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if approximate_counts_enabled() and not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= getattr(settings, 'ADMIN_APPROXIMATE_COUNT_THRESHOLD', 10000):
+                return estimate
+        return super().count
+
+
+class ScalableChangelistMixin:
+    """Cached date hierarchy, approximate counts and the media needed by autocomplete list filters"""
+    paginator = ApproximateCountPaginator
+
+    @property
+    def show_full_result_count(self):
+        # The "N total" link runs an unfiltered COUNT(*), which is what we're avoiding
+        return not approximate_counts_enabled()
+
+    def get_changelist(self, request, **kwargs):
+        return CachedDateHierarchyChangeList
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, type) and issubclass(list_filter, AutocompleteFilter):
+                media += list_filter.media(self.model, self.admin_site)
+        return media
+
 
 # Custom actions for User admin
 def deactivate_users(modeladmin, request, queryset):
@@ -27,12 +195,22 @@ class CustomUserAdmin(UserAdmin):
     search_fields = ('username', 'email', 'first_name', 'last_name')
     ordering = ('-date_joined',)
     actions = [activate_users, deactivate_users, make_staff]
-    
+
+    def get_queryset(self, request):
+        # One correlated COUNT per page row, served by the (user, ...) activity indexes,
+        # instead of a separate COUNT query for every row rendered
+        activity_counts = EcoActivity.objects.filter(
+            user=OuterRef('pk')
+        ).order_by().values('user').annotate(count=Count('pk')).values('count')
+        return super().get_queryset(request).annotate(
+            activity_count=Coalesce(Subquery(activity_counts, output_field=IntegerField()), 0)
+        )
+
     def get_activity_count(self, obj):
-        count = EcoActivity.objects.filter(user=obj).count()
         return format_html('<a href="/admin/main_app/ecoactivity/?user__id__exact={}">{} activities</a>', 
-                         obj.id, count)
+                         obj.id, obj.activity_count)
     get_activity_count.short_description = 'Activities'
+    get_activity_count.admin_order_field = 'activity_count'
 
 # Custom actions for EcoActivity admin
 def mark_as_verified(modeladmin, request, queryset):
@@ -40,12 +218,14 @@ def mark_as_verified(modeladmin, request, queryset):
 mark_as_verified.short_description = "Mark selected activities as verified"
 
 @admin.register(EcoActivity)
-class EcoActivityAdmin(admin.ModelAdmin):
-    list_display = ('user', 'category', 'value', 'unit', 'date', 'impact_level', 
+class EcoActivityAdmin(ScalableChangelistMixin, admin.ModelAdmin):
+    list_display = ('user', 'category', 'value', 'unit', 'co2e_kg', 'date', 'impact_level',
                    'verified', 'verification_status', 'location')
-    list_filter = ('category', 'verified', 'impact_level', 'date', 'user')
+    list_filter = ('category', 'verified', 'impact_level', 'date', UserAutocompleteFilter)
+    autocomplete_fields = ('user', 'verified_by')
+    list_select_related = ('user', 'verified_by')
     search_fields = ('description', 'user__username', 'location', 'tags')
-    readonly_fields = ('created_at', 'updated_at')
+    readonly_fields = ('canonical_value', 'canonical_unit', 'co2e_kg', 'created_at', 'updated_at')
     actions = ['verify_activities', 'mark_high_impact', 'mark_medium_impact', 'mark_low_impact']
     date_hierarchy = 'date'
     
@@ -54,7 +234,7 @@ class EcoActivityAdmin(admin.ModelAdmin):
             'fields': ('user', 'category', 'description', 'value', 'unit', 'date')
         }),
         ('Impact Details', {
-            'fields': ('impact_level', 'location', 'tags'),
+            'fields': ('impact_level', 'co2e_kg', 'canonical_value', 'canonical_unit', 'location', 'tags'),
             'classes': ('collapse',)
         }),
         ('Verification', {
@@ -77,6 +257,12 @@ class EcoActivityAdmin(admin.ModelAdmin):
         return format_html('<span style="color: red;">✗ Not verified</span>')
     verification_status.short_description = 'Verification'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Full-text index instead of icontains over every searched column
+        if not search_term.strip():
+            return queryset, False
+        return search.admin_search(queryset, search_term), False
+
     def verify_activities(self, request, queryset):
         queryset.update(
             verified=True,
@@ -107,12 +293,14 @@ def mark_as_in_progress(modeladmin, request, queryset):
 mark_as_in_progress.short_description = "Mark selected goals as in progress"
 
 @admin.register(SustainabilityGoal)
-class SustainabilityGoalAdmin(admin.ModelAdmin):
+class SustainabilityGoalAdmin(ScalableChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'title', 'category', 'progress_display', 'deadline', 
                    'status', 'priority', 'assigned_to')
-    list_filter = ('status', 'priority', 'category', 'deadline', 'user')
+    list_filter = ('status', 'priority', 'category', 'deadline', UserAutocompleteFilter)
+    autocomplete_fields = ('user', 'assigned_to')
+    list_select_related = ('user', 'assigned_to')
     search_fields = ('title', 'description', 'user__username', 'assigned_to__username')
-    readonly_fields = ('created_at', 'updated_at', 'last_reminder_sent')
+    readonly_fields = ('current_value', 'created_at', 'updated_at', 'last_reminder_sent')
     actions = ['mark_in_progress', 'mark_completed', 'mark_cancelled', 'send_reminders']
     date_hierarchy = 'deadline'
 
@@ -165,10 +353,31 @@ class SustainabilityGoalAdmin(admin.ModelAdmin):
     mark_cancelled.short_description = "Mark as Cancelled"
 
     def send_reminders(self, request, queryset):
-        # TODO: Implement reminder sending logic
-        self.message_user(request, "Reminders have been queued for sending.")
+        sent, skipped = reminders.send_reminders(queryset.select_related('user'))
+        message = f"Sent {sent} reminders."
+        if skipped:
+            message += f" {skipped} goals were skipped because their owner has no email address."
+        self.message_user(request, message)
     send_reminders.short_description = "Send reminders for selected goals"
 
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'activity_count')
+    search_fields = ('name',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(activity_count=Count('activity_links'))
+
+    def activity_count(self, obj):
+        return obj.activity_count
+    activity_count.short_description = 'Activities'
+    activity_count.admin_order_field = 'activity_count'
+
+@admin.register(EmissionFactor)
+class EmissionFactorAdmin(admin.ModelAdmin):
+    list_display = ('category', 'unit', 'kg_co2e_per_unit', 'source', 'updated_at')
+    list_filter = ('category',)
+
 @admin.register(SubscriptionPlan)
 class SubscriptionPlanAdmin(admin.ModelAdmin):
     list_display = ('name', 'price', 'billing_cycle', 'is_active', 'created_at')
@@ -179,9 +388,23 @@ class SubscriptionPlanAdmin(admin.ModelAdmin):
 class UserSubscriptionAdmin(admin.ModelAdmin):
     list_display = ('user', 'plan', 'start_date', 'end_date', 'is_active', 'is_valid')
     list_filter = ('is_active', 'plan')
+    list_select_related = ('user', 'plan')
     search_fields = ('user__username', 'user__email')
     raw_id_fields = ('user',)
 
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'type', 'received_at', 'processed_at', 'attempts')
+    list_filter = ('type', ('processed_at', admin.EmptyFieldListFilter))
+    search_fields = ('event_id',)
+    readonly_fields = ('event_id', 'type', 'payload', 'received_at', 'processed_at', 'attempts', 'last_error')
+    actions = ['retry_events']
+
+    def retry_events(self, request, queryset):
+        count = queryset.filter(processed_at__isnull=True).update(attempts=0, last_error='')
+        self.message_user(request, f"{count} events will be retried by the next process_stripe_events run.")
+    retry_events.short_description = "Retry selected events"
+
 # Unregister the default User admin and register our custom one
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
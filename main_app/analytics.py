@@ -0,0 +1,178 @@
+"""
+Per-category activity series at day, week, month or year resolution.
+
+Series are grouped in the database from the DailyActivityTotal rollup. Every
+period before the current one is closed: its rows are cached per (user,
+resolution, range) and only the open period is queried on each request. A
+write that lands in a closed period bumps that user's version for the
+affected resolutions; rollup rebuilds and emission backfills bump them all.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+from . import metrics
+from .caching import _bump, get_or_build
+
+ANALYTICS_HIT = 'analytics_cache.hit'
+ANALYTICS_MISS = 'analytics_cache.miss'
+ANALYTICS_WAIT = 'analytics_cache.wait'
+metrics.register(ANALYTICS_HIT, ANALYTICS_MISS, ANALYTICS_WAIT)
+
+RESOLUTIONS = {'day': None, 'week': TruncWeek, 'month': TruncMonth, 'year': TruncYear}
+# Range returned when none is given, in periods up to and including the current one
+DEFAULT_PERIODS = {'day': 90, 'week': 52, 'month': 60, 'year': 10}
+MAX_PERIODS = 3660
+
+GENERATION_KEY = 'analytics:gen'
+
+
+def _version_key(user_id, resolution):
+    return f'analytics:gen:{user_id}:{resolution}'
+
+
+def period_start(day, resolution):
+    """First day of the period containing day (weeks start on Monday, as TruncWeek does)"""
+    if resolution == 'week':
+        return day - timedelta(days=day.weekday())
+    if resolution == 'month':
+        return day.replace(day=1)
+    if resolution == 'year':
+        return day.replace(month=1, day=1)
+    return day
+
+
+def next_period(day, resolution):
+    """First day of the period after the one starting on day"""
+    if resolution == 'week':
+        return day + timedelta(days=7)
+    if resolution == 'month':
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    if resolution == 'year':
+        return date(day.year + 1, 1, 1)
+    return day + timedelta(days=1)
+
+
+def default_start(today, resolution):
+    """Start of the period DEFAULT_PERIODS[resolution] - 1 periods before today's"""
+    start = period_start(today, resolution)
+    for _ in range(DEFAULT_PERIODS[resolution] - 1):
+        start = period_start(start - timedelta(days=1), resolution)
+    return start
+
+
+def period_count(start, end, resolution):
+    """How many periods periods(start, end, resolution) returns, without listing them"""
+    if end < start:
+        return 0
+    if resolution == 'week':
+        return (period_start(end, 'week') - period_start(start, 'week')).days // 7 + 1
+    if resolution == 'month':
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    if resolution == 'year':
+        return end.year - start.year + 1
+    return (end - start).days + 1
+
+
+def periods(start, end, resolution):
+    """Start dates of every period from the one containing start to the one containing end"""
+    count = period_count(start, end, resolution)
+    if not count:
+        return []
+    # Never step past the last period: after date.max there is no next one
+    result = [period_start(start, resolution)]
+    for _ in range(count - 1):
+        result.append(next_period(result[-1], resolution))
+    return result
+
+
+def invalidate_series(deltas):
+    """Drop cached closed periods that rollup deltas {(user_id, category, unit, date): ...} reach into"""
+    earliest = {}
+    for user_id, _, _, day in deltas:
+        if user_id not in earliest or day < earliest[user_id]:
+            earliest[user_id] = day
+    today = timezone.localdate()
+    stale = [
+        _version_key(user_id, resolution)
+        for user_id, day in earliest.items()
+        for resolution in RESOLUTIONS
+        if day < period_start(today, resolution)
+    ]
+    if stale:
+        transaction.on_commit(lambda: [_bump(key) for key in stale])
+
+
+def invalidate_all_series():
+    transaction.on_commit(lambda: _bump(GENERATION_KEY))
+
+
+def _rows(user_id, resolution, start, end):
+    """[(period, category, co2e_kg, activity_count)] grouped by the database"""
+    from .models import DailyActivityTotal
+    trunc = RESOLUTIONS[resolution]
+    rows = DailyActivityTotal.objects.filter(
+        user_id=user_id, date__gte=start, date__lte=end
+    ).annotate(
+        period=F('date') if trunc is None else trunc('date')
+    ).values('period', 'category').annotate(
+        co2e_kg=Sum('co2e_kg'), activity_count=Sum('activity_count')
+    ).order_by('period', 'category')
+    return [(row['period'], row['category'], row['co2e_kg'], row['activity_count']) for row in rows]
+
+
+def _closed_rows(user_id, resolution, start, end):
+    version_key = _version_key(user_id, resolution)
+    versions = cache.get_many([GENERATION_KEY, version_key])
+    key = (
+        f'analytics:{user_id}:{resolution}:{versions.get(GENERATION_KEY, 0)}:'
+        f'{versions.get(version_key, 0)}:{start}:{end}'
+    )
+    return get_or_build(
+        key,
+        lambda: _rows(user_id, resolution, start, end),
+        timeout=getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 86400),
+        counters=(ANALYTICS_HIT, ANALYTICS_MISS, ANALYTICS_WAIT),
+    )
+
+
+def series_rows(user_id, resolution, start, end, today=None):
+    """Rows for start..end: closed periods from the cache, the open one straight from the rollup"""
+    today = today or timezone.localdate()
+    start = period_start(start, resolution)
+    open_start = period_start(today, resolution)
+    rows = []
+    if start < open_start:
+        rows += _closed_rows(user_id, resolution, start, min(end, open_start - timedelta(days=1)))
+    if end >= open_start:
+        rows += _rows(user_id, resolution, max(start, open_start), end)
+    return rows
+
+
+def activity_series(user_id, resolution, start, end, category=None, today=None):
+    """Dense per-category series, one value per period, ready for charting"""
+    period_list = periods(start, end, resolution)
+    position = {period: index for index, period in enumerate(period_list)}
+    series = {}
+    for period, row_category, co2e_kg, activity_count in series_rows(user_id, resolution, start, end, today):
+        if category and row_category != category:
+            continue
+        entry = series.setdefault(row_category, {
+            'category': row_category,
+            'co2e_kg': [0.0] * len(period_list),
+            'activity_count': [0] * len(period_list),
+        })
+        entry['co2e_kg'][position[period]] = co2e_kg
+        entry['activity_count'][position[period]] = activity_count
+    return {
+        'resolution': resolution,
+        'start': period_list[0].isoformat() if period_list else start.isoformat(),
+        'end': end.isoformat(),
+        'periods': [period.isoformat() for period in period_list],
+        'series': [series[name] for name in sorted(series)],
+    }
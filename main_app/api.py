@@ -0,0 +1,222 @@
+"""JSON API for EcoActivity, authenticated with the normal session login"""
+import base64
+import json
+from datetime import date
+from functools import wraps
+
+from django.db import transaction
+from django.db.models import Q
+from django.forms.models import model_to_dict
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods
+
+from . import analytics, exports
+from .routers import use_replica
+from .forms import EcoActivityForm
+from .models import EcoActivity, Tag
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_BATCH_SIZE = 1000
+
+
+def api_login_required(view_func):
+    """Like login_required, but answers 401 instead of redirecting to the login page"""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def serialize_activity(activity):
+    return {
+        'id': activity.id,
+        'category': activity.category,
+        'description': activity.description,
+        'value': activity.value,
+        'unit': activity.unit,
+        'co2e_kg': activity.co2e_kg,
+        'date': activity.date.isoformat(),
+        'impact_level': activity.impact_level,
+        'verified': activity.verified,
+        'verified_at': activity.verified_at.isoformat() if activity.verified_at else None,
+        'location': activity.location,
+        'tags': activity.tags,
+        'notes': activity.notes,
+    }
+
+
+def encode_cursor(activity):
+    raw = json.dumps([activity.date.isoformat(), activity.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        day, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return date.fromisoformat(day), int(pk)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def _form_errors(form):
+    return {field: list(errors) for field, errors in form.errors.items()}
+
+
+def _json_body(request):
+    try:
+        return json.loads(request.body or b'null')
+    except ValueError:
+        raise ValueError('Request body must be valid JSON')
+
+
+def _list_activities(request):
+    queryset = EcoActivity.objects.filter(user=request.user)
+    try:
+        queryset = exports.filter_activities(queryset, request.GET)
+        if request.GET.get('impact_level'):
+            queryset = queryset.filter(impact_level=request.GET['impact_level'].upper())
+        limit = min(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        if request.GET.get('cursor'):
+            # Keyset pagination: continue strictly after the last (date, id) seen,
+            # so every page is an index range scan instead of an OFFSET skip
+            last_date, last_id = decode_cursor(request.GET['cursor'])
+            queryset = queryset.filter(Q(date__lt=last_date) | Q(date=last_date, id__lt=last_id))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    page = list(queryset.order_by('-date', '-id')[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return JsonResponse({
+        'results': [serialize_activity(activity) for activity in page[:limit]],
+        'next_cursor': next_cursor,
+    })
+
+
+def _create_activity(request):
+    try:
+        data = _json_body(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+
+    form = EcoActivityForm(data=data)
+    if not form.is_valid():
+        return JsonResponse({'errors': _form_errors(form)}, status=400)
+    activity = form.save(commit=False)
+    activity.user = request.user
+    activity.save()
+    return JsonResponse(serialize_activity(activity), status=201)
+
+
+@use_replica
+@api_login_required
+@require_http_methods(['GET', 'POST'])
+def activity_list(request):
+    """GET a cursor-paginated page of activities, or POST a new one"""
+    if request.method == 'POST':
+        return _create_activity(request)
+    return _list_activities(request)
+
+
+@api_login_required
+@require_http_methods(['GET', 'PUT', 'PATCH', 'DELETE'])
+def activity_detail(request, pk):
+    activity = get_object_or_404(EcoActivity, pk=pk, user=request.user)
+    if request.method == 'GET':
+        return JsonResponse(serialize_activity(activity))
+    if request.method == 'DELETE':
+        activity.delete()
+        return HttpResponse(status=204)
+
+    try:
+        data = _json_body(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+    if request.method == 'PATCH':
+        data = {**model_to_dict(activity, fields=EcoActivityForm.Meta.fields), **data}
+
+    form = EcoActivityForm(data=data, instance=activity)
+    if not form.is_valid():
+        return JsonResponse({'errors': _form_errors(form)}, status=400)
+    activity = form.save()
+    return JsonResponse(serialize_activity(activity))
+
+
+@api_login_required
+@require_http_methods(['POST'])
+def activity_batch_create(request):
+    """Create up to MAX_BATCH_SIZE activities at once; nothing is saved if any item is invalid"""
+    try:
+        items = _json_body(request)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'error': 'Expected a non-empty JSON array'}, status=400)
+    if len(items) > MAX_BATCH_SIZE:
+        return JsonResponse({'error': f'At most {MAX_BATCH_SIZE} activities per batch'}, status=400)
+
+    activities = []
+    errors = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = {'__all__': ['Expected a JSON object']}
+            continue
+        form = EcoActivityForm(data=item)
+        if not form.is_valid():
+            errors[index] = _form_errors(form)
+            continue
+        activity = form.save(commit=False)
+        activity.user = request.user
+        activities.append(activity)
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    with transaction.atomic():
+        activities = EcoActivity.objects.bulk_create(activities)
+    return JsonResponse({'results': [serialize_activity(activity) for activity in activities]}, status=201)
+
+
+@use_replica
+@api_login_required
+@require_http_methods(['GET'])
+def tag_list(request):
+    """The user's tags with how many of their activities carry each one"""
+    tags = Tag.objects.with_activity_counts(user=request.user)
+    return JsonResponse({'results': list(tags.values('name', 'activity_count'))})
+
+
+@use_replica
+@api_login_required
+@require_http_methods(['GET'])
+def activity_series(request):
+    """Per-category kg CO2e and activity counts over time, at ?resolution=day|week|month|year"""
+    resolution = request.GET.get('resolution', 'month')
+    if resolution not in analytics.RESOLUTIONS:
+        return JsonResponse({'error': f'resolution must be one of {", ".join(analytics.RESOLUTIONS)}'}, status=400)
+    today = timezone.localdate()
+    try:
+        end = exports._parse_date(request.GET['end'], 'end') if request.GET.get('end') else today
+        start = exports._parse_date(request.GET['start'], 'start') if request.GET.get('start') else None
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    try:
+        start = start or analytics.default_start(end, resolution)
+    except (OverflowError, ValueError):
+        return JsonResponse({'error': 'end is too close to the earliest supported date; pass start'}, status=400)
+    if start > end:
+        return JsonResponse({'error': 'start must not be after end'}, status=400)
+    if analytics.period_count(start, end, resolution) > analytics.MAX_PERIODS:
+        return JsonResponse({'error': f'At most {analytics.MAX_PERIODS} periods per request'}, status=400)
+
+    category = request.GET.get('category', '').upper() or None
+    return JsonResponse(analytics.activity_series(request.user.pk, resolution, start, end, category, today))
@@ -4,3 +4,11 @@ class MainAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_app'
     verbose_name = 'EcoTrack Main Application'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import signals, stripe_client
+
+        post_migrate.connect(signals.install_row_counters, sender=self)
+        post_migrate.connect(signals.install_search_index, sender=self)
+        stripe_client.configure()
@@ -0,0 +1,33 @@
+"""
+SQLite backend for several processes writing at once.
+
+Opt in with SQLITE_CONCURRENCY=True (see settings). Every new connection
+switches to WAL, so readers never block the writer, and waits for locks
+instead of failing at once. Transactions start with BEGIN IMMEDIATE: they
+take the write lock up front, where busy_timeout applies, rather than on
+their first write, where SQLite gives up with "database is locked" to
+avoid a deadlock between two readers upgrading at the same time.
+"""
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('busy_timeout', 5000),
+    # Durable at every WAL checkpoint; only the last commits can be lost on power failure
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    # Negative means KiB: 64 MiB of page cache per connection
+    ('cache_size', -64 * 1024),
+    ('temp_store', 'MEMORY'),
+]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
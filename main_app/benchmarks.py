@@ -0,0 +1,201 @@
+"""
+Hot-path benchmarks run by `manage.py benchmark`.
+
+Each scenario is one request or ORM call, timed over many iterations against
+a test database seeded from a fixed random seed, so two runs on the same
+machine are comparable. Results are plain dicts that serialise to JSON and
+can be compared against a stored baseline.
+"""
+import math
+import random
+import statistics
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .caching import _bump_generations
+from .models import EcoActivity, SubscriptionPlan, SustainabilityGoal, UserSubscription
+
+UNITS = {'ENERGY': 'kwh', 'WATER': 'l', 'WASTE': 'kg', 'TRANSPORT': 'km', 'RECYCLING': 'kg'}
+WORDS = ['solar', 'bike', 'commute', 'compost', 'shower', 'heating', 'bottles', 'train', 'garden', 'laundry']
+PERCENTILES = (50, 90, 95, 99)
+
+
+def seed(users=50, activities_per_user=200, goals_per_user=5, seed_value=1):
+    """Deterministic data set; returns (member, admin) users to run scenarios as"""
+    rnd = random.Random(seed_value)
+    today = timezone.localdate()
+    password = make_password('benchmark')
+    User.objects.bulk_create([User(username=f'bench{i}', password=password) for i in range(users)])
+    admin = User.objects.create(username='bench-admin', password=password, is_staff=True, is_superuser=True)
+    members = list(User.objects.filter(username__startswith='bench').exclude(pk=admin.pk).order_by('pk'))
+
+    categories = list(UNITS)
+    for member in members:
+        activities = []
+        for _ in range(activities_per_user):
+            category = rnd.choice(categories)
+            activities.append(EcoActivity(
+                user=member,
+                category=category,
+                description=' '.join(rnd.sample(WORDS, 3)),
+                value=round(rnd.uniform(0.5, 50), 2),
+                unit=UNITS[category],
+                date=today - timedelta(days=rnd.randrange(3 * 365)),
+                tags=','.join(rnd.sample(WORDS, 2)),
+            ))
+        EcoActivity.objects.bulk_create(activities, batch_size=1000)
+        goals = []
+        for n in range(goals_per_user):
+            category = rnd.choice(categories)
+            goals.append(SustainabilityGoal(
+                user=member,
+                title=f'Goal {n}',
+                description='Benchmark goal',
+                category=category,
+                unit=UNITS[category],
+                target_value=1000,
+                deadline=today + timedelta(days=rnd.randrange(1, 365)),
+            ))
+        SustainabilityGoal.objects.bulk_create(goals)
+
+    plans = [
+        SubscriptionPlan.objects.create(name=name, price=price, billing_cycle='monthly', features='- Tracking\n- Reports')
+        for name, price in [('Basic', 5), ('Pro', 15), ('Business', 50)]
+    ]
+    UserSubscription.objects.bulk_create([
+        UserSubscription(user=member, plan=rnd.choice(plans), end_date=timezone.now() + timedelta(days=30))
+        for member in members[::2]
+    ])
+    return members[0], admin
+
+
+def _client(user=None):
+    client = Client()
+    if user is not None:
+        client.force_login(user)
+    return client
+
+
+def _request(client, method, path, expected=200, **kwargs):
+    def run():
+        response = getattr(client, method)(path, secure=True, **kwargs)
+        if response.status_code != expected:
+            raise AssertionError(f'{method.upper()} {path} answered {response.status_code}, expected {expected}')
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+    return run
+
+
+def scenarios(member, admin):
+    """{name: (run, setup or None)}; setup runs untimed before every iteration"""
+    member_client = _client(member)
+    admin_client = _client(admin)
+    anonymous_client = _client()
+    counter = iter(range(10 ** 9))
+
+    def add_activity_form():
+        return {
+            'category': 'ENERGY', 'description': f'Benchmark {next(counter)}',
+            'value': '12.5', 'unit': 'kwh', 'date': timezone.localdate().isoformat(),
+        }
+
+    def add_activity():
+        _request(member_client, 'post', '/activity/add/', expected=302, data=add_activity_form())()
+
+    def bulk_create_activities():
+        EcoActivity.objects.bulk_create([
+            EcoActivity(user=member, description='bulk', **{
+                key: value for key, value in add_activity_form().items() if key != 'description'
+            })
+            for _ in range(100)
+        ])
+
+    def reverify_activities():
+        EcoActivity.objects.filter(user=member, category='WATER').update(verified=False)
+
+    return {
+        'dashboard': (_request(member_client, 'get', '/dashboard/'), None),
+        'dashboard_uncached': (
+            _request(member_client, 'get', '/dashboard/'), lambda: _bump_generations([member.pk])
+        ),
+        'pricing_anonymous': (_request(anonymous_client, 'get', '/pricing/'), None),
+        'pricing_member': (_request(member_client, 'get', '/pricing/'), None),
+        'add_activity': (add_activity, None),
+        'search': (_request(member_client, 'get', '/search/', data={'q': 'solar bike'}), None),
+        'api_activity_list': (_request(member_client, 'get', '/api/activities/', data={'limit': 50}), None),
+        'api_series_monthly': (
+            _request(member_client, 'get', '/api/analytics/series/', data={'resolution': 'month'}), None
+        ),
+        'export_activities_csv': (_request(member_client, 'get', '/export/activities/'), None),
+        'admin_activity_changelist': (_request(admin_client, 'get', '/admin/main_app/ecoactivity/'), None),
+        'admin_activity_search': (
+            _request(admin_client, 'get', '/admin/main_app/ecoactivity/', data={'q': 'compost'}), None
+        ),
+        'admin_goal_changelist': (_request(admin_client, 'get', '/admin/main_app/sustainabilitygoal/'), None),
+        'orm_bulk_create_100': (bulk_create_activities, None),
+        'orm_queryset_update': (reverify_activities, None),
+    }
+
+
+def _percentile(ordered, percent):
+    """Nearest-rank percentile of an ascending list"""
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def measure(run, setup=None, iterations=50, warmup=5):
+    """Latency percentiles (ms) and queries per iteration across every database alias"""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        run()
+    timings = []
+    queries = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(sum(len(capture) for capture in captured))
+    timings.sort()
+    result = {f'p{percent}_ms': round(_percentile(timings, percent), 3) for percent in PERCENTILES}
+    result.update({
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'min_ms': round(timings[0], 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': statistics.median_low(queries),
+        'max_queries': max(queries),
+        'iterations': iterations,
+    })
+    return result
+
+
+def compare(results, baseline, threshold=0.2, metric='p50_ms', min_delta_ms=1.0):
+    """
+    Regressions of results against baseline, as human-readable strings.
+
+    Latency regresses when it grows by more than threshold (a fraction) and
+    by at least min_delta_ms, so sub-millisecond noise never fails a run.
+    Query counts are deterministic, so any increase is a regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        before, after = base[metric], result[metric]
+        if after > before * (1 + threshold) and after - before >= min_delta_ms:
+            regressions.append(f'{name}: {metric} {before:.2f} -> {after:.2f} ms (+{(after / before - 1):.0%})')
+        if result['queries'] > base['queries']:
+            regressions.append(f"{name}: queries {base['queries']} -> {result['queries']}")
+    return regressions
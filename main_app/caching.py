@@ -0,0 +1,161 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics, routers
+
+DASHBOARD_HIT = 'dashboard_cache.hit'
+DASHBOARD_MISS = 'dashboard_cache.miss'
+DASHBOARD_WAIT = 'dashboard_cache.wait'
+DASHBOARD_INVALIDATE = 'dashboard_cache.invalidate'
+PRICING_HIT = 'pricing_cache.hit'
+PRICING_MISS = 'pricing_cache.miss'
+PRICING_WAIT = 'pricing_cache.wait'
+metrics.register(DASHBOARD_HIT, DASHBOARD_MISS, DASHBOARD_WAIT, DASHBOARD_INVALIDATE)
+metrics.register(PRICING_HIT, PRICING_MISS, PRICING_WAIT)
+
+PLANS_GENERATION_KEY = 'plans:gen'
+
+# (generation, loaded_at, plans) loaded by this process; replaced whole, so readers never see it half-built
+_active_plans = None
+
+
+def _generation_key(user_id):
+    return f'dashboard:gen:{user_id}'
+
+
+def dashboard_cache_key(user_id):
+    """
+    Key of the current dashboard entry; invalidation moves it to a new generation.
+
+    The date is part of the key, so "this month" moves on at midnight on the 1st
+    rather than up to DASHBOARD_CACHE_TIMEOUT later.
+    """
+    generation = cache.get(_generation_key(user_id), 0)
+    return f'dashboard:{user_id}:{generation}:{timezone.localdate().isoformat()}'
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def _bump_generations(user_ids):
+    for user_id in user_ids:
+        _bump(_generation_key(user_id))
+        metrics.incr(DASHBOARD_INVALIDATE)
+
+
+def invalidate_dashboards(user_ids):
+    """Drop cached dashboards once the current transaction commits"""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        transaction.on_commit(lambda: _bump_generations(user_ids))
+
+
+def get_or_build(key, builder, timeout, lock_timeout=10, wait=2.0, counters=None):
+    """
+    Return the cached value for key, building it with builder() on a miss.
+
+    Only the caller that wins the lock rebuilds; concurrent callers poll for
+    up to `wait` seconds before giving up and building it themselves.
+    builder() always reads from the primary (see routers.primary_reads), so a
+    view that only reads through here gains nothing from use_replica.
+    """
+    hit, miss, waited = counters or (None, None, None)
+    value = cache.get(key)
+    if value is not None:
+        if hit:
+            metrics.incr(hit)
+        return value
+
+    if miss:
+        metrics.incr(miss)
+    lock_key = f'{key}:lock'
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key, token, lock_timeout):
+        if waited:
+            metrics.incr(waited)
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = cache.get(key)
+            if value is not None:
+                return value
+
+    try:
+        with routers.primary_reads():
+            value = builder()
+        cache.set(key, value, timeout)
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    return value
+
+
+def get_dashboard_context(user_id, builder):
+    return get_or_build(
+        dashboard_cache_key(user_id),
+        builder,
+        timeout=getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300),
+        counters=(DASHBOARD_HIT, DASHBOARD_MISS, DASHBOARD_WAIT),
+    )
+
+
+def plans_generation():
+    return cache.get(PLANS_GENERATION_KEY, 0)
+
+
+def invalidate_plans():
+    """Make every process reload its plans once the current transaction commits"""
+    transaction.on_commit(lambda: _bump(PLANS_GENERATION_KEY))
+
+
+def process_cached(entry, generation, load):
+    """
+    (entry, value) for a process-local (generation, loaded_at, value) entry.
+
+    load() runs again when the generation has moved or the entry is older than
+    PROCESS_CACHE_MAX_AGE. Generation bumps only reach other workers through a
+    shared cache, so without REDIS_URL the age limit is what bounds staleness.
+    """
+    now = time.monotonic()
+    if entry is not None:
+        cached_generation, loaded_at, value = entry
+        if cached_generation == generation and now - loaded_at < getattr(settings, 'PROCESS_CACHE_MAX_AGE', 60):
+            return entry, value
+    value = load()
+    return (generation, now, value), value
+
+
+def _load_active_plans():
+    from .models import SubscriptionPlan
+    with routers.primary_reads():
+        plans = list(SubscriptionPlan.objects.filter(is_active=True).order_by('price'))
+    for plan in plans:
+        plan.feature_list = plan.get_feature_list()
+    return plans
+
+
+def get_active_plans():
+    """Active plans with feature_list parsed, cached in-process until a plan is saved or the copy ages out"""
+    global _active_plans
+    _active_plans, plans = process_cached(_active_plans, plans_generation(), _load_active_plans)
+    return plans
+
+
+def get_pricing_page(builder):
+    """Rendered pricing page for anonymous visitors, rebuilt when the plans change"""
+    return get_or_build(
+        f'pricing:anonymous:{plans_generation()}',
+        builder,
+        timeout=getattr(settings, 'PRICING_CACHE_TIMEOUT', 3600),
+        counters=(PRICING_HIT, PRICING_MISS, PRICING_WAIT),
+    )
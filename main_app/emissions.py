@@ -0,0 +1,201 @@
+"""
+Conversion of activity values into canonical units and kg CO2e.
+
+EcoActivity.unit is free text, so UNIT_ALIASES maps every spelling we accept
+onto a canonical unit and a multiplier. EmissionFactor then gives the kg CO2e
+per canonical unit of each category. Both steps are linear in value, so each
+(category, unit) pair boils down to two coefficients: batches are converted
+with NumPy, and stored rows are refreshed with one UPDATE per pair.
+"""
+import re
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, FloatField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from . import routers
+from .caching import _bump, process_cached
+
+# Normalised unit (lower case, no spaces or dots) -> (canonical unit, multiplier)
+UNIT_ALIASES = {
+    # energy -> kWh
+    'kwh': ('kwh', 1.0),
+    'kilowatthour': ('kwh', 1.0),
+    'kilowatthours': ('kwh', 1.0),
+    'wh': ('kwh', 0.001),
+    'mwh': ('kwh', 1000.0),
+    'therm': ('kwh', 29.3071),
+    'therms': ('kwh', 29.3071),
+    # volume -> litres
+    'l': ('l', 1.0),
+    'litre': ('l', 1.0),
+    'litres': ('l', 1.0),
+    'liter': ('l', 1.0),
+    'liters': ('l', 1.0),
+    'ml': ('l', 0.001),
+    'm3': ('l', 1000.0),
+    'm³': ('l', 1000.0),
+    'gal': ('l', 3.78541),
+    'gallon': ('l', 3.78541),
+    'gallons': ('l', 3.78541),
+    # distance -> km
+    'km': ('km', 1.0),
+    'kms': ('km', 1.0),
+    'kilometre': ('km', 1.0),
+    'kilometres': ('km', 1.0),
+    'kilometer': ('km', 1.0),
+    'kilometers': ('km', 1.0),
+    'm': ('km', 0.001),
+    'mi': ('km', 1.609344),
+    'mile': ('km', 1.609344),
+    'miles': ('km', 1.609344),
+    # mass -> kg
+    'kg': ('kg', 1.0),
+    'kgs': ('kg', 1.0),
+    'kilogram': ('kg', 1.0),
+    'kilograms': ('kg', 1.0),
+    'g': ('kg', 0.001),
+    'grams': ('kg', 0.001),
+    't': ('kg', 1000.0),
+    'tonne': ('kg', 1000.0),
+    'tonnes': ('kg', 1000.0),
+    'lb': ('kg', 0.45359237),
+    'lbs': ('kg', 0.45359237),
+    'pounds': ('kg', 0.45359237),
+}
+
+FACTORS_GENERATION_KEY = 'emission_factors:gen'
+
+# (generation, loaded_at, {(category, canonical unit): kg CO2e per unit}) loaded by this process
+_factors = None
+
+
+def normalize_unit(unit):
+    return re.sub(r'[\s.]', '', (unit or '').lower())
+
+
+def resolve_unit(unit):
+    """(canonical unit, multiplier) for a free-text unit, or ('', None) when it is not recognised"""
+    return UNIT_ALIASES.get(normalize_unit(unit), ('', None))
+
+
+def _load_factors():
+    from .models import EmissionFactor
+    with routers.primary_reads():
+        return {
+            (category, unit): factor
+            for category, unit, factor in EmissionFactor.objects.values_list('category', 'unit', 'kg_co2e_per_unit')
+        }
+
+
+def get_factors():
+    """Emission factors keyed by (category, canonical unit), cached in-process (see caching.process_cached)"""
+    global _factors
+    _factors, factors = process_cached(_factors, cache.get(FACTORS_GENERATION_KEY, 0), _load_factors)
+    return factors
+
+
+def invalidate_factors():
+    """Make every process reload the factors once the current transaction commits"""
+    transaction.on_commit(lambda: _bump(FACTORS_GENERATION_KEY))
+
+
+def coefficients(categories, units, factors=None):
+    """
+    Per-row (canonical units, multipliers, kg CO2e per original unit) arrays.
+
+    Each distinct category and unit is resolved once and broadcast back with
+    np.unique's inverse index. Unknown units and missing factors come out as NaN.
+    """
+    factors = get_factors() if factors is None else factors
+    categories = np.asarray(categories, dtype=object)
+    units = np.asarray([normalize_unit(unit) for unit in units], dtype=object)
+
+    distinct_units, unit_index = np.unique(units.astype(str), return_inverse=True)
+    resolved = [UNIT_ALIASES.get(unit, ('', np.nan)) for unit in distinct_units]
+    canonical_units = np.array([unit for unit, _ in resolved], dtype=object)[unit_index]
+    multipliers = np.array([multiplier for _, multiplier in resolved], dtype=float)[unit_index]
+
+    keys = np.char.add(np.char.add(categories.astype(str), '|'), canonical_units.astype(str))
+    distinct_keys, key_index = np.unique(keys, return_inverse=True)
+    per_unit = np.array(
+        [factors.get(tuple(key.split('|', 1)), np.nan) for key in distinct_keys], dtype=float
+    )[key_index]
+    return canonical_units, multipliers, multipliers * per_unit
+
+
+def convert(categories, units, values, factors=None):
+    """(canonical values, canonical units, kg CO2e) arrays for a batch of activities"""
+    canonical_units, multipliers, co2e_per_unit = coefficients(categories, units, factors)
+    values = np.asarray(values, dtype=float)
+    return values * multipliers, canonical_units, values * co2e_per_unit
+
+
+def _nan_to_none(value):
+    return None if np.isnan(value) else float(value)
+
+
+def annotate_activities(activities, factors=None):
+    """Set canonical_value, canonical_unit and co2e_kg on unsaved EcoActivity instances"""
+    if not activities:
+        return
+    canonical_values, canonical_units, co2e = convert(
+        [activity.category for activity in activities],
+        [activity.unit for activity in activities],
+        [activity.value for activity in activities],
+        factors,
+    )
+    for activity, value, unit, kg in zip(activities, canonical_values, canonical_units, co2e):
+        activity.canonical_value = _nan_to_none(value)
+        activity.canonical_unit = unit
+        activity.co2e_kg = _nan_to_none(kg)
+
+
+def _pair_coefficients(queryset, factors=None):
+    pairs = list(queryset.order_by().values_list('category', 'unit').distinct())
+    if not pairs:
+        return []
+    categories, units = zip(*pairs)
+    return zip(categories, units, *coefficients(categories, units, factors))
+
+
+def refresh_activity_emissions(queryset, factors=None):
+    """
+    Recompute the stored emission columns of the activities in queryset.
+
+    Pass a _base_manager queryset: this issues plain UPDATEs, one per
+    (category, unit) pair, and must not go through EcoActivityQuerySet.update.
+    """
+    rows = 0
+    for category, unit, canonical_unit, multiplier, co2e_per_unit in _pair_coefficients(queryset, factors):
+        activities = queryset.filter(category=category, unit=unit)
+        if np.isnan(multiplier):
+            rows += activities.update(canonical_value=None, canonical_unit='', co2e_kg=None)
+            continue
+        rows += activities.update(
+            canonical_value=F('value') * float(multiplier),
+            canonical_unit=canonical_unit,
+            co2e_kg=None if np.isnan(co2e_per_unit) else F('value') * float(co2e_per_unit),
+        )
+    return rows
+
+
+def refresh_rollup_emissions(queryset):
+    """Set co2e_kg and canonical_total on the DailyActivityTotal rows in queryset from their activities"""
+    from .models import EcoActivity
+    activities = EcoActivity._base_manager.filter(
+        user=OuterRef('user'), category=OuterRef('category'), unit=OuterRef('unit'), date=OuterRef('date'),
+    ).order_by().values('user')
+
+    def total(field):
+        rows = activities.annotate(total=Sum(field)).values('total')
+        return Coalesce(Subquery(rows), 0.0, output_field=FloatField())
+
+    rows = 0
+    for unit in list(queryset.order_by().values_list('unit', flat=True).distinct()):
+        rows += queryset.filter(unit=unit).update(
+            co2e_kg=total('co2e_kg'), canonical_total=total('canonical_value'), canonical_unit=resolve_unit(unit)[0],
+        )
+    return rows
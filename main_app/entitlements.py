@@ -0,0 +1,97 @@
+"""
+What a user's subscription entitles them to, cached per user.
+
+An entry lives until the subscription's end_date (so expiry needs no
+invalidation) and is dropped whenever the UserSubscription row is saved or
+deleted: checkout webhooks, cancel() and the admin all go through save().
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import cache
+from django.db import transaction
+from django.shortcuts import redirect
+from django.utils import timezone
+
+
+class Entitlement:
+    """A user's plan and subscription state; checking it never touches the database"""
+
+    def __init__(self, plan_id=None, plan_name=None, end_date=None, is_active=False):
+        self.plan_id = plan_id
+        self.plan_name = plan_name
+        self.end_date = end_date
+        self.is_active = is_active
+
+    @property
+    def is_valid(self):
+        return self.is_active and self.end_date is not None and self.end_date > timezone.now()
+
+    def has_plan(self, *plan_names):
+        """Valid subscription, and on one of plan_names when any are given"""
+        return self.is_valid and (not plan_names or self.plan_name in plan_names)
+
+    def __repr__(self):
+        return f'<Entitlement {self.plan_name or "none"} valid={self.is_valid}>'
+
+
+NO_ENTITLEMENT = Entitlement()
+
+
+def _cache_key(user_id):
+    return f'entitlement:{user_id}'
+
+
+def _load(user_id):
+    from .models import UserSubscription
+    row = UserSubscription.objects.filter(user_id=user_id).values(
+        'plan_id', 'plan__name', 'end_date', 'is_active'
+    ).first()
+    if row is None:
+        return NO_ENTITLEMENT
+    return Entitlement(row['plan_id'], row['plan__name'], row['end_date'], row['is_active'])
+
+
+def get_entitlement(user):
+    if not user.is_authenticated:
+        return NO_ENTITLEMENT
+    key = _cache_key(user.pk)
+    cached = cache.get(key)
+    if cached is not None:
+        return Entitlement(*cached)
+
+    entitlement = _load(user.pk)
+    timeout = getattr(settings, 'ENTITLEMENT_CACHE_TIMEOUT', 86400)
+    if entitlement.is_valid:
+        # Expire exactly when the subscription does
+        timeout = min(timeout, max(int((entitlement.end_date - timezone.now()).total_seconds()), 1))
+    cache.set(key, (entitlement.plan_id, entitlement.plan_name, entitlement.end_date, entitlement.is_active), timeout)
+    return entitlement
+
+
+def invalidate_entitlements(user_ids):
+    """Drop cached entitlements once the current transaction commits"""
+    keys = [_cache_key(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def plan_required(*plan_names):
+    """
+    View decorator: require a valid subscription, on one of plan_names if given.
+
+    Anonymous users go to the login page, users without the plan to pricing.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return redirect_to_login(request.get_full_path())
+            if not request.entitlement.has_plan(*plan_names):
+                messages.info(request, 'This feature needs an active subscription to a plan that includes it.')
+                return redirect('main_app:pricing')
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,107 @@
+import csv
+import json
+import zlib
+from datetime import date
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+ACTIVITY_FIELDS = [
+    'id', 'date', 'category', 'description', 'value', 'unit', 'co2e_kg', 'impact_level',
+    'verified', 'verified_at', 'location', 'tags', 'notes', 'created_at', 'updated_at',
+]
+
+GOAL_FIELDS = [
+    'id', 'title', 'description', 'category', 'target_value', 'current_value', 'unit',
+    'deadline', 'status', 'priority', 'reminder_frequency', 'last_reminder_sent',
+    'notes', 'created_at', 'updated_at',
+]
+
+
+class Echo:
+    """File-like object whose write() hands the line straight back to csv.writer's caller"""
+    def write(self, value):
+        return value
+
+
+def _parse_date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a date in YYYY-MM-DD format')
+
+
+def _parse_bool(value, name):
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError(f'{name} must be true or false')
+
+
+def filter_activities(queryset, params):
+    """Apply ?start=&end=&category=&verified=&tag= filters; raises ValueError on bad input"""
+    if params.get('start'):
+        queryset = queryset.filter(date__gte=_parse_date(params['start'], 'start'))
+    if params.get('end'):
+        queryset = queryset.filter(date__lte=_parse_date(params['end'], 'end'))
+    if params.get('category'):
+        queryset = queryset.filter(category=params['category'].upper())
+    if params.get('verified'):
+        queryset = queryset.filter(verified=_parse_bool(params['verified'], 'verified'))
+    if params.get('tag'):
+        queryset = queryset.with_tag(params['tag'])
+    return queryset
+
+
+def filter_goals(queryset, params):
+    """Apply ?start=&end= (on deadline), ?category= and ?status= filters"""
+    if params.get('start'):
+        queryset = queryset.filter(deadline__gte=_parse_date(params['start'], 'start'))
+    if params.get('end'):
+        queryset = queryset.filter(deadline__lte=_parse_date(params['end'], 'end'))
+    if params.get('category'):
+        queryset = queryset.filter(category=params['category'].upper())
+    if params.get('status'):
+        queryset = queryset.filter(status=params['status'].upper())
+    return queryset
+
+
+def csv_lines(queryset, fields, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield writer.writerow(row)
+
+
+def jsonl_lines(queryset, fields, chunk_size=CHUNK_SIZE):
+    for row in queryset.values(*fields).iterator(chunk_size=chunk_size):
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def encode_stream(lines, buffer_size=BUFFER_SIZE):
+    """Join lines into ~64KB byte blocks so the server isn't handed one tiny chunk per row"""
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= buffer_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_stream(blocks, level=6):
+    """Compress a byte stream into a gzip stream on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
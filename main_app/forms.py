@@ -29,10 +29,23 @@ class EcoActivityForm(forms.ModelForm):
         for field in self.fields.values():
             field.widget.attrs['class'] = 'form-control'
 
+class EcoActivityImportForm(EcoActivityForm):
+    """Validates imported rows with the same rules as EcoActivityForm plus the optional detail fields"""
+    class Meta(EcoActivityForm.Meta):
+        fields = EcoActivityForm.Meta.fields + ['impact_level', 'notes', 'location', 'tags']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['impact_level'].required = False
+
+    def clean_impact_level(self):
+        return self.cleaned_data.get('impact_level') or EcoActivity._meta.get_field('impact_level').default
+
 class SustainabilityGoalForm(forms.ModelForm):
+    """Progress (current_value) is tracked from logged activities, so it is not editable"""
     class Meta:
         model = SustainabilityGoal
-        fields = ['title', 'description', 'target_value', 'current_value', 'unit', 'deadline']
+        fields = ['title', 'description', 'category', 'target_value', 'unit', 'deadline']
         widgets = {
             'deadline': forms.DateInput(attrs={'type': 'date'}),
             'description': forms.Textarea(attrs={'rows': 3}),
@@ -42,11 +55,3 @@ class SustainabilityGoalForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         for field in self.fields.values():
             field.widget.attrs['class'] = 'form-control'
-
-    def clean(self):
-        cleaned_data = super().clean()
-        target_value = cleaned_data.get('target_value')
-        current_value = cleaned_data.get('current_value')
-        
-        if target_value and current_value and current_value > target_value:
-            raise forms.ValidationError("Current value cannot be greater than target value.")
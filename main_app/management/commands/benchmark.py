@@ -0,0 +1,104 @@
+import json
+import platform
+import time
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.utils import timezone
+from main_app import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Times views, admin changelists and ORM hot paths against a seeded test database; '
+        'writes JSON results and fails on regressions against --baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only run this scenario (repeatable)')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--activities-per-user', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write the JSON results to this file')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed latency growth over the baseline, as a fraction (default 0.2)')
+        parser.add_argument('--metric', default='p50_ms',
+                            choices=[f'p{percent}_ms' for percent in benchmarks.PERCENTILES] + ['mean_ms'],
+                            help='Latency statistic compared against the baseline')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as f:
+                    baseline = json.load(f)['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f'Cannot read baseline {options["baseline"]}: {e}')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = self.run_benchmarks(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'users': options['users'],
+                'activities_per_user': options['activities_per_user'],
+                'seed': options['seed'],
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+        if baseline is not None:
+            regressions = benchmarks.compare(results, baseline, options['threshold'], options['metric'])
+            if regressions:
+                for regression in regressions:
+                    self.stdout.write(self.style.ERROR(regression))
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["baseline"]}'))
+
+    def run_benchmarks(self, options):
+        started = time.monotonic()
+        cache.clear()
+        member, admin = benchmarks.seed(
+            users=options['users'],
+            activities_per_user=options['activities_per_user'],
+            seed_value=options['seed'],
+        )
+        self.stdout.write(f'Seeded test database in {time.monotonic() - started:.1f}s')
+
+        available = benchmarks.scenarios(member, admin)
+        names = options['scenarios'] or list(available)
+        unknown = set(names) - set(available)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+        self.stdout.write(f'{"scenario":<28}{"p50":>9}{"p95":>9}{"p99":>9}{"queries":>9}')
+        results = {}
+        for name in names:
+            run, setup = available[name]
+            result = results[name] = benchmarks.measure(run, setup, options['iterations'], options['warmup'])
+            self.stdout.write(
+                f'{name:<28}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}'
+                f'{result["p99_ms"]:>9.2f}{result["queries"]:>9}'
+            )
+        return results
@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as DefaultWrapper
+from main_app.backends.sqlite3.base import DatabaseWrapper as ConcurrentWrapper
+
+MODES = {
+    'default': (DefaultWrapper, 'django.db.backends.sqlite3'),
+    'concurrent': (ConcurrentWrapper, 'main_app.backends.sqlite3'),
+}
+
+
+def _settings_dict(path, engine):
+    return {**connections[DEFAULT_DB_ALIAS].settings_dict, 'ENGINE': engine, 'NAME': path, 'OPTIONS': {}}
+
+
+def _worker(args):
+    """
+    Run transactions shaped like an activity save; returns (committed, failed).
+
+    Each reads the shared rollup row, works for `think` seconds holding only a
+    read lock, then upgrades to a write: inserts its rows and moves the rollup.
+    A deferred transaction that upgrades while another holds the write lock
+    fails at once with "database is locked"; busy_timeout never gets a say.
+    """
+    mode, path, worker, transactions, rows, think = args
+    wrapper_class, engine = MODES[mode]
+    connection = wrapper_class(_settings_dict(path, engine), alias=f'bench_{worker}')
+    committed = failed = 0
+    for n in range(transactions):
+        try:
+            # What atomic() does on entry
+            connection.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT total FROM bench_total WHERE id = 1')
+                total = cursor.fetchone()[0]
+                time.sleep(think)
+                cursor.executemany(
+                    'INSERT INTO bench (worker, n, value, payload) VALUES (%s, %s, %s, %s)',
+                    [(worker, n, float(i), 'x' * 200) for i in range(rows)],
+                )
+                cursor.execute('UPDATE bench_total SET total = %s WHERE id = 1', [total + rows])
+            connection.commit()
+            committed += 1
+        except OperationalError:
+            connection.rollback()
+            failed += 1
+        finally:
+            connection.set_autocommit(True)
+    connection.close()
+    return committed, failed
+
+
+class Command(BaseCommand):
+    help = 'Compares concurrent-writer throughput of the default and SQLITE_CONCURRENCY SQLite modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Writer processes')
+        parser.add_argument('--transactions', type=int, default=200, help='Transactions per worker')
+        parser.add_argument('--rows', type=int, default=20, help='Rows inserted per transaction')
+        parser.add_argument('--think-ms', type=float, default=5,
+                            help='Work between the read and the write of each transaction, in milliseconds')
+
+    def run_mode(self, mode, options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.sqlite3')
+            with sqlite3.connect(path) as conn:
+                if mode == 'concurrent':
+                    # WAL sticks to the file: a deployed database was switched long ago,
+                    # not by every worker at the same instant
+                    conn.execute('PRAGMA journal_mode = WAL')
+                conn.execute(
+                    'CREATE TABLE bench (id INTEGER PRIMARY KEY, worker INTEGER, n INTEGER, value REAL, payload TEXT)'
+                )
+                conn.execute('CREATE INDEX bench_worker ON bench (worker)')
+                # One hot rollup row that every transaction reads and then updates
+                conn.execute('CREATE TABLE bench_total (id INTEGER PRIMARY KEY, total INTEGER)')
+                conn.execute('INSERT INTO bench_total (id, total) VALUES (1, 0)')
+            jobs = [(mode, path, worker, options['transactions'], options['rows'], options['think_ms'] / 1000)
+                    for worker in range(options['workers'])]
+            started = time.monotonic()
+            with multiprocessing.get_context('spawn').Pool(options['workers']) as pool:
+                results = pool.map(_worker, jobs)
+            elapsed = time.monotonic() - started
+        committed = sum(result[0] for result in results)
+        failed = sum(result[1] for result in results)
+        return committed, failed, elapsed
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['workers']} workers x {options['transactions']} transactions x {options['rows']} rows, "
+            f"{options['think_ms']:g} ms between read and write"
+        )
+        throughput = {}
+        for mode in MODES:
+            committed, failed, elapsed = self.run_mode(mode, options)
+            throughput[mode] = committed / elapsed
+            self.stdout.write(
+                f'{mode:>10}: {committed} committed, {failed} failed ("database is locked"), '
+                f'{elapsed:.2f}s, {throughput[mode]:.0f} transactions/s'
+            )
+        if throughput['default']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Concurrent mode: {throughput['concurrent'] / throughput['default']:.1f}x the committed throughput"
+            ))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+from main_app import analytics, emissions
+from main_app.caching import invalidate_dashboards
+from main_app.models import EcoActivity, DailyActivityTotal
+
+
+class Command(BaseCommand):
+    help = 'Backfills canonical values and kg CO2e on activities and the daily rollup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20000,
+                            help='Activity ids covered per transaction')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute every activity, e.g. after changing an emission factor '
+                                 '(default: only activities without a CO2e figure)')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        batch_size = options['batch_size']
+        factors = emissions.get_factors()
+        activities = EcoActivity._base_manager.all()
+        if not options['all']:
+            activities = activities.filter(co2e_kg__isnull=True)
+
+        # Walk fixed id ranges so each transaction stays short and a rerun resumes cheaply
+        bounds = activities.aggregate(low=Min('pk'), high=Max('pk'))
+        updated = 0
+        if bounds['low'] is not None:
+            for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+                with transaction.atomic():
+                    updated += emissions.refresh_activity_emissions(
+                        activities.filter(pk__gte=start, pk__lt=start + batch_size), factors
+                    )
+                self.stdout.write(f'  activities up to id {start + batch_size - 1}: {updated} updated')
+
+        with transaction.atomic():
+            rollup_rows = emissions.refresh_rollup_emissions(DailyActivityTotal._base_manager.all())
+            invalidate_dashboards(DailyActivityTotal.objects.values_list('user_id', flat=True).distinct())
+            analytics.invalidate_all_series()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {updated} activities and {rollup_rows} rollup rows in {elapsed:.2f}s'
+        ))
@@ -0,0 +1,335 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError, OutputWrapper
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from main_app.forms import EcoActivityImportForm
+from main_app.models import EcoActivity
+
+
+def _part_path(path, index, count):
+    """Each worker gets its own checkpoint and error file"""
+    return path if count == 1 else f'{path}.{index}'
+
+
+def _data_start(path, fmt):
+    """Byte offset of the first record (just past the CSV header)"""
+    if fmt != 'csv':
+        return 0
+    with open(path, 'rb') as fh:
+        fh.readline()
+        return fh.tell()
+
+
+def split_ranges(path, fmt, count):
+    """Split a file into `count` byte ranges that start on record boundaries"""
+    start = _data_start(path, fmt)
+    size = os.path.getsize(path)
+    step = max((size - start) // count, 1)
+    bounds = [start]
+    with open(path, 'rb') as fh:
+        for index in range(1, count):
+            fh.seek(max(start + step * index - 1, bounds[-1]))
+            fh.readline()
+            bounds.append(min(max(fh.tell(), bounds[-1]), size))
+    bounds.append(size)
+    return [(bounds[i], bounds[i + 1]) for i in range(count) if bounds[i] < bounds[i + 1]]
+
+
+def iter_records(path, fmt, start, end):
+    """
+    Yield (offset_after_record, record) pairs for records in [start, end).
+
+    Reads one record at a time, so memory use does not depend on file size.
+    Quoted CSV fields may span lines; a record is complete once its quotes balance.
+    """
+    with open(path, 'rb') as fh:
+        header = None
+        if fmt == 'csv':
+            header = next(csv.reader([fh.readline().decode('utf-8-sig')]))
+            header = [name.strip() for name in header]
+        fh.seek(start)
+        while fh.tell() < end:
+            line = fh.readline()
+            if not line:
+                break
+            if fmt == 'csv':
+                while line.count(b'"') % 2:
+                    more = fh.readline()
+                    if not more:
+                        break
+                    line += more
+            text = line.decode('utf-8').strip()
+            if not text:
+                continue
+            try:
+                if fmt == 'csv':
+                    values = next(csv.reader(io.StringIO(text)))
+                    record = dict(zip(header, values))
+                else:
+                    record = json.loads(text)
+                    if not isinstance(record, dict):
+                        raise ValueError('Expected a JSON object')
+            except (ValueError, csv.Error) as e:
+                yield fh.tell(), {'__raw__': text, '__error__': str(e)}
+                continue
+            yield fh.tell(), record
+
+
+def read_checkpoint(path, start, end):
+    """The checkpoint saved for byte range [start, end), or None when there is none"""
+    if not (path and os.path.exists(path)):
+        return None
+    with open(path) as fh:
+        checkpoint = json.load(fh)
+    if (checkpoint['start'], checkpoint['end']) != (start, end):
+        raise CommandError(
+            f'{path} covers a different byte range; '
+            'resume with the same --workers value or start over without --resume'
+        )
+    return checkpoint
+
+
+def prune_errors(path, resume_from):
+    """
+    Drop rejected rows that a resumed run reads again, so they are not written twice.
+
+    resume_from holds (checkpoint offset, end) per byte range; rows recorded past
+    their range's checkpoint, and any line cut short by a crash, are dropped.
+    """
+    if not os.path.exists(path):
+        return
+    tmp_path = f'{path}.tmp'
+    with open(path) as source, open(tmp_path, 'w') as out:
+        for line in source:
+            try:
+                offset = json.loads(line)['offset']
+            except (ValueError, KeyError):
+                continue
+            if not any(resumed < offset <= end for resumed, end in resume_from):
+                out.write(line)
+    os.replace(tmp_path, path)
+
+
+class ActivityImporter:
+    """Validates and inserts one byte range of an import file"""
+
+    def __init__(self, path, fmt, default_user=None, batch_size=1000,
+                 errors_path=None, checkpoint_path=None, resume=False, log=print):
+        self.path = path
+        self.fmt = fmt
+        self.default_user = default_user
+        self.batch_size = batch_size
+        self.errors_path = errors_path
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        self.log = log
+        self.users = {}
+
+    def resolve_user(self, username):
+        username = username or self.default_user
+        if not username:
+            raise ValueError('No user column and no --user given')
+        if username not in self.users:
+            self.users[username] = User.objects.filter(username=username).first()
+        if self.users[username] is None:
+            raise ValueError(f'Unknown user "{username}"')
+        return self.users[username]
+
+    def build_activity(self, record):
+        """Return (activity, None) for a valid record or (None, errors)"""
+        if '__error__' in record:
+            return None, {'__all__': [record['__error__']]}
+        data = dict(record)
+        username = data.pop('user', None) or data.pop('username', None)
+        try:
+            user = self.resolve_user(username)
+        except ValueError as e:
+            return None, {'user': [str(e)]}
+        form = EcoActivityImportForm(data=data)
+        if not form.is_valid():
+            return None, {field: list(errors) for field, errors in form.errors.items()}
+        activity = form.save(commit=False)
+        activity.user = user
+        return activity, None
+
+    def load_checkpoint(self, start, end):
+        checkpoint = read_checkpoint(self.checkpoint_path, start, end) if self.resume else None
+        if checkpoint is None:
+            return start, 0, 0
+        return checkpoint['offset'], checkpoint['imported'], checkpoint['failed']
+
+    def save_checkpoint(self, start, end, offset, imported, failed):
+        if not self.checkpoint_path:
+            return
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as fh:
+            json.dump({
+                'path': os.path.abspath(self.path),
+                'start': start,
+                'end': end,
+                'offset': offset,
+                'imported': imported,
+                'failed': failed,
+            }, fh)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def run(self, start, end, label=''):
+        offset, imported, failed = self.load_checkpoint(start, end)
+        errors = open(self.errors_path, 'a' if self.resume else 'w') if self.errors_path else None
+        batch = []
+        processed = 0
+        started = time.monotonic()
+
+        def flush(offset):
+            nonlocal batch, imported
+            if errors:
+                errors.flush()
+            with transaction.atomic():
+                EcoActivity.objects.bulk_create(batch, batch_size=self.batch_size)
+            imported += len(batch)
+            batch = []
+            self.save_checkpoint(start, end, offset, imported, failed)
+            elapsed = time.monotonic() - started
+            rate = processed / elapsed if elapsed else 0
+            self.log(f'{label}{imported} imported, {failed} failed ({rate:.0f} rows/s)')
+
+        try:
+            for offset, record in iter_records(self.path, self.fmt, offset, end):
+                processed += 1
+                activity, row_errors = self.build_activity(record)
+                if activity is not None:
+                    batch.append(activity)
+                else:
+                    failed += 1
+                    if errors:
+                        errors.write(json.dumps({'offset': offset, 'errors': row_errors, 'row': record}) + '\n')
+                if processed % self.batch_size == 0:
+                    flush(offset)
+            flush(offset)
+        finally:
+            if errors:
+                errors.close()
+        return {'imported': imported, 'failed': failed, 'processed': processed}
+
+
+def _run_worker(options):
+    import django
+    django.setup()
+    index = options.pop('index')
+    start, end = options.pop('range')
+    stdout = OutputWrapper(sys.stdout)
+
+    def log(msg):
+        stdout.write(msg)
+        stdout.flush()
+
+    importer = ActivityImporter(log=log, **options)
+    return importer.run(start, end, label=f'[worker {index}] ')
+
+
+class Command(BaseCommand):
+    help = 'Streams EcoActivity rows from a CSV or JSONL file into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (with header row) or JSONL file')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Defaults to the file extension')
+        parser.add_argument('--user', help='Username for rows without a "user" column')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per bulk insert and per transaction')
+        parser.add_argument('--errors', help='Where to write rejected rows (default: <path>.errors.jsonl)')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint)')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue from the last checkpoint instead of starting over')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Split the file across this many processes '
+                                 '(CSV fields must not contain line breaks)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        workers = max(options['workers'], 1)
+        settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+        if workers > 1 and settings_dict['ENGINE'] == 'django.db.backends.sqlite3':
+            # Concurrent writers fail at once with "database is locked" instead of waiting
+            raise CommandError(
+                '--workers needs a database that takes concurrent writers; '
+                'on SQLite set SQLITE_CONCURRENCY=True or import with one worker'
+            )
+        ranges = split_ranges(path, fmt, workers)
+        errors_path = options['errors'] or f'{path}.errors.jsonl'
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+
+        jobs = [{
+            'index': index,
+            'range': byte_range,
+            'path': path,
+            'fmt': fmt,
+            'default_user': options['user'],
+            'batch_size': options['batch_size'],
+            'errors_path': _part_path(errors_path, index, len(ranges)),
+            'checkpoint_path': _part_path(checkpoint_path, index, len(ranges)),
+            'resume': options['resume'],
+        } for index, byte_range in enumerate(ranges)]
+        if options['resume']:
+            self.prune_error_files(errors_path, jobs)
+
+        started = time.monotonic()
+        if len(jobs) <= 1:
+            results = []
+            for job in jobs:
+                job.pop('index')
+                start, end = job.pop('range')
+                importer = ActivityImporter(log=self.stdout.write, **job)
+                results.append(importer.run(start, end))
+        else:
+            # Forked children must not share the parent's database connections
+            connections.close_all()
+            try:
+                with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+                    results = list(pool.map(_run_worker, jobs))
+            finally:
+                # Also after a failed worker, so --resume and the next run start from one file
+                self.merge_error_files(
+                    errors_path, [job['errors_path'] for job in jobs], options['resume']
+                )
+
+        elapsed = time.monotonic() - started
+        imported = sum(result['imported'] for result in results)
+        failed = sum(result['failed'] for result in results)
+        processed = sum(result['processed'] for result in results)
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} activities, {failed} rejected, '
+            f'in {elapsed:.1f}s ({rate:.0f} rows/s)'
+        ))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'Rejected rows written to {errors_path}'))
+
+    def prune_error_files(self, errors_path, jobs):
+        """Forget rejected rows past each range's checkpoint, in the merged file and any leftover parts"""
+        resume_from = []
+        for job in jobs:
+            start, end = job['range']
+            checkpoint = read_checkpoint(job['checkpoint_path'], start, end)
+            resume_from.append((checkpoint['offset'] if checkpoint else start, end))
+        for path in {errors_path, *(job['errors_path'] for job in jobs)}:
+            prune_errors(path, resume_from)
+
+    def merge_error_files(self, errors_path, part_paths, resume):
+        with open(errors_path, 'a' if resume else 'w') as out:
+            for part_path in part_paths:
+                if os.path.exists(part_path):
+                    with open(part_path) as part:
+                        for line in part:
+                            out.write(line)
+                    os.remove(part_path)
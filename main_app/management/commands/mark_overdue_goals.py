@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+from main_app.models import SustainabilityGoal
+
+
+class Command(BaseCommand):
+    help = 'Marks open goals past their deadline as OVERDUE (safe to run every minute)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Goals updated per statement and per transaction')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        changed = SustainabilityGoal.objects.mark_overdue(batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Marked {changed} goals overdue in {elapsed:.2f}s'))
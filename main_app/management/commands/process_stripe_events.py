@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from main_app.models import StripeEvent
+from main_app.utils import process_stripe_event
+
+
+class Command(BaseCommand):
+    help = 'Drains queued Stripe webhook events in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Leave events alone once they have failed this many times')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new events instead of exiting when the queue is empty')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep between polls when the queue is empty (with --loop)')
+
+    def handle(self, *args, **options):
+        processed = failed = 0
+        try:
+            while True:
+                done, errors = self.process_batch(options['batch_size'], options['max_attempts'])
+                processed += done
+                failed += errors
+                if done or errors:
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        stuck = StripeEvent.objects.pending().filter(attempts__gte=options['max_attempts']).count()
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} events, {failed} failures'))
+        if stuck:
+            self.stdout.write(self.style.WARNING(
+                f'{stuck} events reached --max-attempts and need attention (see last_error in the admin)'
+            ))
+
+    def process_batch(self, batch_size, max_attempts):
+        """Claim and handle one batch; returns (processed, failed)"""
+        with transaction.atomic():
+            events = StripeEvent.objects.pending(max_attempts)
+            if connection.features.has_select_for_update_skip_locked:
+                # Parallel workers each take a different batch
+                events = events.select_for_update(skip_locked=True)
+            events = list(events[:batch_size])
+            failed = 0
+            for event in events:
+                event.attempts += 1
+                try:
+                    with transaction.atomic():
+                        process_stripe_event(event)
+                except Exception as e:
+                    event.last_error = f'{type(e).__name__}: {e}'
+                    failed += 1
+                else:
+                    event.processed_at = timezone.now()
+                    event.last_error = ''
+            StripeEvent.objects.bulk_update(events, ['attempts', 'processed_at', 'last_error'])
+        return len(events) - failed, failed
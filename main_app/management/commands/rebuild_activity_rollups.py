@@ -0,0 +1,95 @@
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Coalesce
+from main_app import analytics
+from main_app.models import EcoActivity, DailyActivityTotal
+
+KEY_FIELDS = ('user_id', 'category', 'unit', 'date')
+
+
+def _key(row):
+    return tuple(row[field] for field in KEY_FIELDS)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily activity rollup from raw activities, or checks it for drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report rows that differ from the raw activities',
+        )
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def expected_rows(self, batch_size):
+        return EcoActivity.objects.order_by(*KEY_FIELDS).values(*KEY_FIELDS).annotate(
+            total=Sum('value'),
+            activity_count=Count('pk'),
+            co2e_kg=Coalesce(Sum('co2e_kg'), 0.0),
+            canonical_unit=Max('canonical_unit'),
+            canonical_total=Coalesce(Sum('canonical_value'), 0.0),
+        ).iterator(chunk_size=batch_size)
+
+    def stored_rows(self, batch_size):
+        return DailyActivityTotal.objects.order_by(*KEY_FIELDS).values(
+            *KEY_FIELDS, 'total', 'activity_count', 'co2e_kg', 'canonical_unit', 'canonical_total'
+        ).iterator(chunk_size=batch_size)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if options['check']:
+            drift = self.check_drift(batch_size)
+            if drift:
+                raise CommandError(f'{drift} rollup rows have drifted; run without --check to rebuild')
+            self.stdout.write(self.style.SUCCESS('Rollup matches raw activities'))
+            return
+
+        created = 0
+        with transaction.atomic():
+            DailyActivityTotal.objects.all().delete()
+            batch = []
+            for row in self.expected_rows(batch_size):
+                batch.append(DailyActivityTotal(**row))
+                if len(batch) >= batch_size:
+                    DailyActivityTotal.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            DailyActivityTotal.objects.bulk_create(batch)
+            created += len(batch)
+            analytics.invalidate_all_series()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} rollup rows'))
+
+    def check_drift(self, batch_size):
+        """Merge-join both ordered streams so memory stays flat"""
+        expected = self.expected_rows(batch_size)
+        stored = self.stored_rows(batch_size)
+        want, have = next(expected, None), next(stored, None)
+        drift = 0
+        while want is not None or have is not None:
+            if have is None or (want is not None and _key(want) < _key(have)):
+                self.stdout.write(self.style.WARNING(f'Missing rollup row {_key(want)}'))
+                drift += 1
+                want = next(expected, None)
+            elif want is None or _key(have) < _key(want):
+                self.stdout.write(self.style.WARNING(f'Orphaned rollup row {_key(have)}'))
+                drift += 1
+                have = next(stored, None)
+            else:
+                if (want['activity_count'] != have['activity_count']
+                        or want['canonical_unit'] != have['canonical_unit']
+                        or not math.isclose(want['total'], have['total'], abs_tol=1e-6)
+                        or not math.isclose(want['co2e_kg'], have['co2e_kg'], abs_tol=1e-6)
+                        or not math.isclose(want['canonical_total'], have['canonical_total'], abs_tol=1e-6)):
+                    self.stdout.write(self.style.WARNING(
+                        f'Rollup row {_key(have)} has {have["total"]} ({have["activity_count"]}, '
+                        f'{have["co2e_kg"]} kg CO2e, {have["canonical_total"]} {have["canonical_unit"]}), '
+                        f'expected {want["total"]} ({want["activity_count"]}, {want["co2e_kg"]} kg CO2e, '
+                        f'{want["canonical_total"]} {want["canonical_unit"]})'
+                    ))
+                    drift += 1
+                want, have = next(expected, None), next(stored, None)
+        return drift
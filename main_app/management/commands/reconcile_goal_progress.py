@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Abs
+from main_app.models import EcoActivity, SustainabilityGoal, progress_subquery
+
+TOLERANCE = 1e-6
+
+
+class Command(BaseCommand):
+    help = 'Recomputes every goal\'s current_value from raw activities in one set-based pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only report goals whose progress differs from the raw activities',
+        )
+
+    def handle(self, *args, **options):
+        expected = progress_subquery(EcoActivity, 'value', 'canonical_value')
+        drifted = SustainabilityGoal.objects.annotate(expected=expected).annotate(
+            drift=Abs(F('current_value') - F('expected'))
+        ).filter(drift__gt=TOLERANCE)
+
+        if options['check']:
+            count = drifted.count()
+            for goal in drifted.values('pk', 'title', 'current_value', 'expected')[:20]:
+                self.stdout.write(
+                    f"  goal {goal['pk']} ({goal['title']}): "
+                    f"stored {goal['current_value']}, expected {goal['expected']}"
+                )
+            if count:
+                raise CommandError(f'{count} goals have drifted; run without --check to recompute')
+            self.stdout.write(self.style.SUCCESS('Goal progress matches raw activities'))
+            return
+
+        with transaction.atomic():
+            count = drifted.count()
+            updated = SustainabilityGoal.objects.update(current_value=expected)
+        self.stdout.write(self.style.SUCCESS(f'Recomputed {updated} goals ({count} had drifted)'))
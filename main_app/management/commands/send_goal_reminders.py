@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from main_app import reminders
+
+
+class Command(BaseCommand):
+    help = 'Emails reminders for every goal whose next reminder is due'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Goals rendered, sent and stamped per batch')
+        parser.add_argument('--limit', type=int, help='Stop after this many goals')
+
+    def handle(self, *args, **options):
+        stats = reminders.send_due_reminders(
+            batch_size=options['batch_size'],
+            limit=options['limit'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        elapsed = stats['elapsed']
+        rate = stats['goals'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {stats['sent']} reminders for {stats['goals']} due goals "
+            f"({stats['skipped']} without an email address) in {elapsed:.1f}s ({rate:.0f} goals/s)"
+        ))
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from main_app import metrics
+
+
+class Command(BaseCommand):
+    help = 'Shows the shared cache counters (dashboard cache hits/misses, Stripe latency, etc.)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset counters after printing')
+
+    def handle(self, *args, **options):
+        if not metrics.shared():
+            backend = settings.CACHES['default']['BACKEND']
+            raise CommandError(
+                f'The default cache ({backend}) is private to each process, so this command only '
+                'sees its own counters (all zero). Set REDIS_URL to share counters between workers.'
+            )
+        values = metrics.snapshot()
+        for name, value in values.items():
+            self.stdout.write(f'{name}: {value}')
+
+        hits = values.get('dashboard_cache.hit', 0)
+        misses = values.get('dashboard_cache.miss', 0)
+        if hits + misses:
+            self.stdout.write(self.style.SUCCESS(
+                f'Dashboard cache hit ratio: {hits / (hits + misses):.1%}'
+            ))
+
+        requests = values.get('stripe.requests', 0)
+        if requests:
+            self.stdout.write(self.style.SUCCESS(
+                f"Stripe: {values.get('stripe.latency_ms', 0) / requests:.0f} ms average, "
+                f"{values.get('stripe.errors', 0) / requests:.1%} errors, "
+                f"{values.get('stripe.rejected', 0)} rejected by the circuit breaker"
+            ))
+
+        if options['reset']:
+            metrics.reset()
+            self.stdout.write(self.style.WARNING('Counters reset'))
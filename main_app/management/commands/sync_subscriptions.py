@@ -0,0 +1,94 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import stripe
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from main_app.entitlements import invalidate_entitlements
+from main_app.models import UserSubscription
+
+# Stripe subscription statuses that still grant access
+ACTIVE_STATUSES = {'active', 'trialing', 'past_due'}
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = 'Re-syncs subscriptions with Stripe, then deactivates every expired subscription'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Stripe subscriptions compared and bulk-updated per batch')
+        parser.add_argument('--skip-stripe', action='store_true',
+                            help='Only run the local expiry sweep')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if not options['skip_stripe']:
+            if stripe.api_key:
+                seen, changed, missing = self.sync_with_stripe(options['batch_size'])
+                self.stdout.write(
+                    f'Compared {seen} Stripe subscriptions, updated {changed} local rows, '
+                    f'deactivated {missing} missing from Stripe'
+                )
+            else:
+                self.stdout.write(self.style.WARNING('STRIPE_SECRET_KEY is not set; skipping the Stripe sync'))
+
+        # After the sync, so renewals it just picked up are not expired
+        expired = UserSubscription.objects.expire()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Deactivated {expired} expired subscriptions in {elapsed:.1f}s'))
+
+    def sync_with_stripe(self, batch_size):
+        started_at = timezone.now()
+        seen_ids = set()
+        changed = 0
+        # auto_paging_iter fetches 100 per request (Stripe's maximum) as we go
+        subscriptions = stripe.Subscription.list(status='all', limit=100).auto_paging_iter()
+        for batch in _chunks(subscriptions, batch_size):
+            seen_ids.update(subscription.id for subscription in batch)
+            changed += self.apply_batch(batch)
+        missing = self.deactivate_missing(seen_ids, started_at, batch_size)
+        return len(seen_ids), changed, missing
+
+    def deactivate_missing(self, seen_ids, started_at, batch_size):
+        """Deactivate active rows whose Stripe subscription was not listed; rows newer than the sync are skipped"""
+        candidates = UserSubscription.objects.filter(
+            is_active=True, stripe_subscription_id__isnull=False, start_date__lt=started_at,
+        ).exclude(stripe_subscription_id='').values_list('pk', 'stripe_subscription_id')
+        missing = [pk for pk, subscription_id in candidates.iterator() if subscription_id not in seen_ids]
+        deactivated = 0
+        for chunk in _chunks(missing, batch_size):
+            with transaction.atomic():
+                rows = UserSubscription.objects.filter(pk__in=chunk, is_active=True)
+                user_ids = list(rows.values_list('user_id', flat=True))
+                deactivated += rows.update(is_active=False)
+                invalidate_entitlements(user_ids)
+        return deactivated
+
+    def apply_batch(self, batch):
+        remote = {subscription.id: subscription for subscription in batch}
+        with transaction.atomic():
+            local = UserSubscription.objects.select_for_update().filter(stripe_subscription_id__in=list(remote))
+            updates = []
+            for row in local:
+                subscription = remote[row.stripe_subscription_id]
+                is_active = subscription.status in ACTIVE_STATUSES
+                end_date = datetime.fromtimestamp(subscription.current_period_end, tz=dt_timezone.utc)
+                if (row.is_active, row.end_date) != (is_active, end_date):
+                    row.is_active = is_active
+                    row.end_date = end_date
+                    updates.append(row)
+            UserSubscription.objects.bulk_update(updates, ['is_active', 'end_date'], batch_size=500)
+            invalidate_entitlements(row.user_id for row in updates)
+        return len(updates)
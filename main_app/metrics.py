@@ -0,0 +1,44 @@
+"""Lightweight counters kept in the default cache so every worker shares them"""
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+PREFIX = 'metrics:'
+
+_registered = []
+
+
+def register(*names):
+    for name in names:
+        if name not in _registered:
+            _registered.append(name)
+
+
+def registered():
+    return list(_registered)
+
+
+def shared():
+    """False when the default cache lives in this process, so other workers' counters never show up"""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def incr(name, delta=1):
+    key = PREFIX + name
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # Counter not created yet (or evicted); add() keeps concurrent creators honest
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def snapshot(names=None):
+    names = registered() if names is None else names
+    values = cache.get_many([PREFIX + name for name in names])
+    return {name: values.get(PREFIX + name, 0) for name in names}
+
+
+def reset(names=None):
+    names = registered() if names is None else names
+    cache.delete_many([PREFIX + name for name in names])
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from . import routers
+from .entitlements import get_entitlement
+
+REPLICA_PIN_COOKIE = 'replica_pin'
+
+
+class EntitlementMiddleware:
+    """Adds request.entitlement, loaded (from cache) only when a view or template reads it"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.entitlement = SimpleLazyObject(lambda: get_entitlement(request.user))
+        return self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve reads of use_replica views and admin changelists from the replica.
+
+    Only GET and HEAD qualify. Any other request marks the client with a
+    short-lived cookie that keeps its reads on the primary until replication
+    has caught up, so users always see their own writes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._replica_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request._replica_token is not None:
+                routers.stop_replica_reads(request._replica_token)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and routers.replica_configured():
+            response.set_cookie(
+                REPLICA_PIN_COOKIE,
+                '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 10),
+                secure=request.is_secure(),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (request.method in ('GET', 'HEAD') and routers.replica_configured()
+                and REPLICA_PIN_COOKIE not in request.COOKIES and self.wants_replica(request, view_func)):
+            request._replica_token = routers.start_replica_reads()
+
+    def wants_replica(self, request, view_func):
+        if getattr(view_func, 'use_replica', False):
+            return True
+        match = request.resolver_match
+        return (match is not None and match.namespace == 'admin'
+                and bool(match.url_name) and match.url_name.endswith('_changelist'))
@@ -0,0 +1,90 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:04
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def backfill_daily_totals(apps, schema_editor):
+    EcoActivity = apps.get_model("main_app", "EcoActivity")
+    DailyActivityTotal = apps.get_model("main_app", "DailyActivityTotal")
+    db_alias = schema_editor.connection.alias
+
+    rows = (
+        EcoActivity.objects.using(db_alias)
+        .order_by()
+        .values("user_id", "category", "unit", "date")
+        .annotate(total=Sum("value"), activity_count=Count("pk"))
+    )
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(DailyActivityTotal(**row))
+        if len(batch) >= 2000:
+            DailyActivityTotal.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    DailyActivityTotal.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("main_app", "0005_subscriptionplan_stripe_price_id_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyActivityTotal",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "category",
+                    models.CharField(
+                        choices=[
+                            ("ENERGY", "Energy Consumption"),
+                            ("WATER", "Water Usage"),
+                            ("WASTE", "Waste Management"),
+                            ("TRANSPORT", "Transportation"),
+                            ("RECYCLING", "Recycling"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("unit", models.CharField(max_length=20)),
+                ("date", models.DateField()),
+                ("total", models.FloatField(default=0)),
+                ("activity_count", models.IntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "date"], name="main_app_da_user_id_5f76ec_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailyactivitytotal",
+            constraint=models.UniqueConstraint(
+                fields=("user", "category", "unit", "date"),
+                name="unique_daily_activity_total",
+            ),
+        ),
+        migrations.RunPython(backfill_daily_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0006_dailyactivitytotal"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="ecoactivity",
+            index=models.Index(
+                fields=["user", "date", "id"], name="main_app_ec_user_id_ed62a8_idx"
+            ),
+        ),
+    ]
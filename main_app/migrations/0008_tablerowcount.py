@@ -0,0 +1,28 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0007_ecoactivity_user_date_id_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TableRowCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("table_name", models.CharField(max_length=100, unique=True)),
+                ("row_count", models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,128 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def backfill_tags(apps, schema_editor):
+    EcoActivity = apps.get_model("main_app", "EcoActivity")
+    Tag = apps.get_model("main_app", "Tag")
+    ActivityTag = apps.get_model("main_app", "ActivityTag")
+    db_alias = schema_editor.connection.alias
+    tag_ids = {}
+
+    activities = EcoActivity.objects.using(db_alias).exclude(tags="").order_by("pk")
+    last_pk = 0
+    while True:
+        batch = list(
+            activities.filter(pk__gt=last_pk).values_list("pk", "tags")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1][0]
+
+        parsed = {}
+        for pk, tags in batch:
+            names = {name.strip().lower()[:50] for name in tags.split(",")}
+            parsed[pk] = sorted(name for name in names if name)
+        missing = {name for names in parsed.values() for name in names} - set(tag_ids)
+        if missing:
+            Tag.objects.using(db_alias).bulk_create(
+                [Tag(name=name) for name in missing], ignore_conflicts=True
+            )
+            tag_ids.update(
+                Tag.objects.using(db_alias)
+                .filter(name__in=missing)
+                .values_list("name", "pk")
+            )
+        ActivityTag.objects.using(db_alias).bulk_create(
+            [
+                ActivityTag(activity_id=pk, tag_id=tag_ids[name])
+                for pk, names in parsed.items()
+                for name in names
+            ],
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0008_tablerowcount"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Tag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+            ],
+            options={
+                "ordering": ["name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ActivityTag",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "activity",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tag_links",
+                        to="main_app.ecoactivity",
+                    ),
+                ),
+                (
+                    "tag",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="activity_links",
+                        to="main_app.tag",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="ecoactivity",
+            name="tag_set",
+            field=models.ManyToManyField(
+                blank=True,
+                help_text="Normalized copy of tags, kept in sync on save",
+                related_name="activities",
+                through="main_app.ActivityTag",
+                to="main_app.tag",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="activitytag",
+            index=models.Index(
+                fields=["tag", "activity"], name="main_app_ac_tag_id_1c6830_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="activitytag",
+            constraint=models.UniqueConstraint(
+                fields=("activity", "tag"), name="unique_activity_tag"
+            ),
+        ),
+        migrations.RunPython(backfill_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:20
+
+from django.db import migrations
+
+# SQLite gets its FTS5 table from main_app.search.install_sqlite_fts (post_migrate)
+SEARCH_VECTOR = """
+ALTER TABLE main_app_ecoactivity ADD COLUMN search_vector tsvector
+GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', coalesce(description, '')), 'A')
+    || setweight(to_tsvector('simple', coalesce(tags, '')), 'B')
+    || setweight(to_tsvector('simple', coalesce(location, '')), 'C')
+    || setweight(to_tsvector('simple', coalesce(notes, '')), 'D')
+) STORED
+"""
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(SEARCH_VECTOR)
+    schema_editor.execute(
+        "CREATE INDEX main_app_ecoactivity_search_idx "
+        "ON main_app_ecoactivity USING GIN (search_vector)"
+    )
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS main_app_ecoactivity_search_idx")
+    schema_editor.execute(
+        "ALTER TABLE main_app_ecoactivity DROP COLUMN IF EXISTS search_vector"
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0009_tags"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
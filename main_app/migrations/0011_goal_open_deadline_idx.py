@@ -0,0 +1,20 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0010_ecoactivity_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="sustainabilitygoal",
+            index=models.Index(
+                condition=models.Q(("status__in", ["PENDING", "IN_PROGRESS"])),
+                fields=["deadline"],
+                name="goal_open_deadline_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:18
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def schedule_reminders(apps, schema_editor):
+    SustainabilityGoal = apps.get_model("main_app", "SustainabilityGoal")
+    goals = SustainabilityGoal.objects.using(schema_editor.connection.alias)
+    frequencies = (
+        goals.order_by().values_list("reminder_frequency", flat=True).distinct()
+    )
+    for frequency in list(frequencies):
+        if frequency > 0:
+            goals.filter(reminder_frequency=frequency).update(
+                next_reminder_at=Coalesce("last_reminder_sent", "created_at")
+                + timedelta(days=frequency)
+            )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0011_goal_open_deadline_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sustainabilitygoal",
+            name="next_reminder_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="When the next reminder is due, kept in step with reminder_frequency",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(schedule_reminders, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="sustainabilitygoal",
+            index=models.Index(
+                condition=models.Q(("status__in", ["PENDING", "IN_PROGRESS"])),
+                fields=["next_reminder_at"],
+                name="goal_reminder_due_idx",
+            ),
+        ),
+    ]
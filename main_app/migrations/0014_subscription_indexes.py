@@ -0,0 +1,26 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0013_stripeevent"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="usersubscription",
+            index=models.Index(
+                condition=models.Q(("is_active", True)),
+                fields=["end_date"],
+                name="subscription_active_end_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="usersubscription",
+            index=models.Index(
+                fields=["stripe_subscription_id"], name="main_app_us_stripe__145a86_idx"
+            ),
+        ),
+    ]
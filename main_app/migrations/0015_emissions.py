@@ -0,0 +1,129 @@
+# Generated by Django 4.2.17 on 2026-10-18 19:28
+
+import django.core.validators
+from django.db import migrations, models
+
+# Approximate UK government (DEFRA) greenhouse gas conversion factors;
+# adjust them in the admin, then run compute_emissions --all
+DEFAULT_FACTORS = [
+    ("ENERGY", "kwh", 0.207),
+    ("WATER", "l", 0.000421),
+    ("TRANSPORT", "km", 0.170),
+    ("WASTE", "kg", 0.467),
+    ("RECYCLING", "kg", 0.021),
+]
+
+
+def seed_factors(apps, schema_editor):
+    EmissionFactor = apps.get_model("main_app", "EmissionFactor")
+    EmissionFactor.objects.using(schema_editor.connection.alias).bulk_create(
+        [
+            EmissionFactor(
+                category=category,
+                unit=unit,
+                kg_co2e_per_unit=factor,
+                source="DEFRA conversion factors (approx.)",
+            )
+            for category, unit, factor in DEFAULT_FACTORS
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0014_subscription_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmissionFactor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "category",
+                    models.CharField(
+                        choices=[
+                            ("ENERGY", "Energy Consumption"),
+                            ("WATER", "Water Usage"),
+                            ("WASTE", "Waste Management"),
+                            ("TRANSPORT", "Transportation"),
+                            ("RECYCLING", "Recycling"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "unit",
+                    models.CharField(
+                        help_text="Canonical unit: kwh, l, km or kg", max_length=20
+                    ),
+                ),
+                (
+                    "kg_co2e_per_unit",
+                    models.FloatField(
+                        validators=[django.core.validators.MinValueValidator(0.0)]
+                    ),
+                ),
+                ("source", models.CharField(blank=True, max_length=255)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["category", "unit"],
+            },
+        ),
+        migrations.AddField(
+            model_name="dailyactivitytotal",
+            name="co2e_kg",
+            field=models.FloatField(
+                default=0,
+                help_text="total in kg CO2e, at the emission factor in force when written",
+            ),
+        ),
+        migrations.AddField(
+            model_name="ecoactivity",
+            name="canonical_unit",
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name="ecoactivity",
+            name="canonical_value",
+            field=models.FloatField(
+                blank=True,
+                editable=False,
+                help_text="value converted to canonical_unit; empty when the unit is not recognised",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="ecoactivity",
+            name="co2e_kg",
+            field=models.FloatField(
+                blank=True,
+                editable=False,
+                help_text="Emissions in kg CO2e; empty when no emission factor applies",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="ecoactivity",
+            index=models.Index(
+                fields=["user", "date", "co2e_kg"],
+                name="main_app_ec_user_id_c99ba0_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="emissionfactor",
+            constraint=models.UniqueConstraint(
+                fields=("category", "unit"), name="unique_emission_factor"
+            ),
+        ),
+        migrations.RunPython(seed_factors, migrations.RunPython.noop),
+    ]
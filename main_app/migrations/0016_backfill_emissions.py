@@ -0,0 +1,125 @@
+import re
+
+from django.db import migrations, transaction
+from django.db.models import F, Max, Min
+
+CHUNK_SIZE = 20000
+
+# Frozen copies of main_app.emissions.UNIT_ALIASES and normalize_unit as of this
+# migration, so later edits to the app code don't change what it does
+UNIT_ALIASES = {
+    # energy -> kWh
+    "kwh": ("kwh", 1.0),
+    "kilowatthour": ("kwh", 1.0),
+    "kilowatthours": ("kwh", 1.0),
+    "wh": ("kwh", 0.001),
+    "mwh": ("kwh", 1000.0),
+    "therm": ("kwh", 29.3071),
+    "therms": ("kwh", 29.3071),
+    # volume -> litres
+    "l": ("l", 1.0),
+    "litre": ("l", 1.0),
+    "litres": ("l", 1.0),
+    "liter": ("l", 1.0),
+    "liters": ("l", 1.0),
+    "ml": ("l", 0.001),
+    "m3": ("l", 1000.0),
+    "m³": ("l", 1000.0),
+    "gal": ("l", 3.78541),
+    "gallon": ("l", 3.78541),
+    "gallons": ("l", 3.78541),
+    # distance -> km
+    "km": ("km", 1.0),
+    "kms": ("km", 1.0),
+    "kilometre": ("km", 1.0),
+    "kilometres": ("km", 1.0),
+    "kilometer": ("km", 1.0),
+    "kilometers": ("km", 1.0),
+    "m": ("km", 0.001),
+    "mi": ("km", 1.609344),
+    "mile": ("km", 1.609344),
+    "miles": ("km", 1.609344),
+    # mass -> kg
+    "kg": ("kg", 1.0),
+    "kgs": ("kg", 1.0),
+    "kilogram": ("kg", 1.0),
+    "kilograms": ("kg", 1.0),
+    "g": ("kg", 0.001),
+    "grams": ("kg", 0.001),
+    "t": ("kg", 1000.0),
+    "tonne": ("kg", 1000.0),
+    "tonnes": ("kg", 1000.0),
+    "lb": ("kg", 0.45359237),
+    "lbs": ("kg", 0.45359237),
+    "pounds": ("kg", 0.45359237),
+}
+
+
+def normalize_unit(unit):
+    return re.sub(r"[\s.]", "", (unit or "").lower())
+
+
+def _coefficients(factors, pairs):
+    """(category, unit, canonical unit, multiplier, kg CO2e per unit) for known units"""
+    for category, unit in pairs:
+        canonical_unit, multiplier = UNIT_ALIASES.get(normalize_unit(unit), ("", None))
+        if multiplier is not None:
+            factor = factors.get((category, canonical_unit))
+            per_unit = None if factor is None else multiplier * factor
+            yield category, unit, canonical_unit, multiplier, per_unit
+
+
+def backfill_emissions(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    EcoActivity = apps.get_model("main_app", "EcoActivity")
+    DailyActivityTotal = apps.get_model("main_app", "DailyActivityTotal")
+    EmissionFactor = apps.get_model("main_app", "EmissionFactor")
+    factors = {
+        (category, unit): factor
+        for category, unit, factor in EmissionFactor.objects.using(alias).values_list(
+            "category", "unit", "kg_co2e_per_unit"
+        )
+    }
+
+    # One short transaction per id range, like compute_emissions
+    activities = EcoActivity.objects.using(alias)
+    bounds = activities.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is not None:
+        for start in range(bounds["low"], bounds["high"] + 1, CHUNK_SIZE):
+            chunk = activities.filter(pk__gte=start, pk__lt=start + CHUNK_SIZE)
+            pairs = list(chunk.order_by().values_list("category", "unit").distinct())
+            with transaction.atomic(using=alias):
+                for (
+                    category,
+                    unit,
+                    canonical_unit,
+                    multiplier,
+                    per_unit,
+                ) in _coefficients(factors, pairs):
+                    chunk.filter(category=category, unit=unit).update(
+                        canonical_value=F("value") * multiplier,
+                        canonical_unit=canonical_unit,
+                        co2e_kg=None if per_unit is None else F("value") * per_unit,
+                    )
+
+    totals = DailyActivityTotal.objects.using(alias)
+    pairs = list(totals.order_by().values_list("category", "unit").distinct())
+    for category, unit, _, _, per_unit in _coefficients(factors, pairs):
+        if per_unit is not None:
+            with transaction.atomic(using=alias):
+                totals.filter(category=category, unit=unit).update(
+                    co2e_kg=F("total") * per_unit
+                )
+
+
+class Migration(migrations.Migration):
+    # Each chunk commits on its own instead of holding locks for the whole table
+    atomic = False
+
+    dependencies = [
+        ("main_app", "0015_emissions"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_emissions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,178 @@
+# Generated by Django 4.2.17 on 2026-10-18 20:05
+
+import re
+
+from django.db import migrations, models
+from django.db.models import (
+    Case,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    OuterRef,
+    Subquery,
+    Sum,
+    When,
+)
+from django.db.models.functions import Coalesce, TruncDate
+
+# Frozen copies of main_app.emissions.UNIT_ALIASES and normalize_unit as of this
+# migration, so later edits to the app code don't change what it does
+UNIT_ALIASES = {
+    # energy -> kWh
+    "kwh": ("kwh", 1.0),
+    "kilowatthour": ("kwh", 1.0),
+    "kilowatthours": ("kwh", 1.0),
+    "wh": ("kwh", 0.001),
+    "mwh": ("kwh", 1000.0),
+    "therm": ("kwh", 29.3071),
+    "therms": ("kwh", 29.3071),
+    # volume -> litres
+    "l": ("l", 1.0),
+    "litre": ("l", 1.0),
+    "litres": ("l", 1.0),
+    "liter": ("l", 1.0),
+    "liters": ("l", 1.0),
+    "ml": ("l", 0.001),
+    "m3": ("l", 1000.0),
+    "m³": ("l", 1000.0),
+    "gal": ("l", 3.78541),
+    "gallon": ("l", 3.78541),
+    "gallons": ("l", 3.78541),
+    # distance -> km
+    "km": ("km", 1.0),
+    "kms": ("km", 1.0),
+    "kilometre": ("km", 1.0),
+    "kilometres": ("km", 1.0),
+    "kilometer": ("km", 1.0),
+    "kilometers": ("km", 1.0),
+    "m": ("km", 0.001),
+    "mi": ("km", 1.609344),
+    "mile": ("km", 1.609344),
+    "miles": ("km", 1.609344),
+    # mass -> kg
+    "kg": ("kg", 1.0),
+    "kgs": ("kg", 1.0),
+    "kilogram": ("kg", 1.0),
+    "kilograms": ("kg", 1.0),
+    "g": ("kg", 0.001),
+    "grams": ("kg", 0.001),
+    "t": ("kg", 1000.0),
+    "tonne": ("kg", 1000.0),
+    "tonnes": ("kg", 1000.0),
+    "lb": ("kg", 0.45359237),
+    "lbs": ("kg", 0.45359237),
+    "pounds": ("kg", 0.45359237),
+}
+
+
+def normalize_unit(unit):
+    return re.sub(r"[\s.]", "", (unit or "").lower())
+
+
+def backfill_canonical_progress(apps, schema_editor):
+    alias = schema_editor.connection.alias
+    EcoActivity = apps.get_model("main_app", "EcoActivity")
+    DailyActivityTotal = apps.get_model("main_app", "DailyActivityTotal")
+    SustainabilityGoal = apps.get_model("main_app", "SustainabilityGoal")
+
+    # Rollup rows take their canonical total from the activities' stored canonical_value
+    totals = DailyActivityTotal.objects.using(alias)
+    canonical_total = (
+        EcoActivity.objects.using(alias)
+        .filter(
+            user=OuterRef("user"),
+            category=OuterRef("category"),
+            unit=OuterRef("unit"),
+            date=OuterRef("date"),
+        )
+        .order_by()
+        .values("user")
+        .annotate(total=Sum("canonical_value"))
+        .values("total")
+    )
+    for unit in list(totals.order_by().values_list("unit", flat=True).distinct()):
+        totals.filter(unit=unit).update(
+            canonical_unit=UNIT_ALIASES.get(normalize_unit(unit), ("", None))[0],
+            canonical_total=Coalesce(
+                Subquery(canonical_total), 0.0, output_field=FloatField()
+            ),
+        )
+
+    goals = SustainabilityGoal.objects.using(alias)
+    for unit in list(goals.order_by().values_list("unit", flat=True).distinct()):
+        canonical_unit, multiplier = UNIT_ALIASES.get(normalize_unit(unit), ("", None))
+        goals.filter(unit=unit).update(
+            canonical_unit=canonical_unit, unit_multiplier=multiplier or 1.0
+        )
+
+    # Recount progress under the new matching, as progress_subquery does
+    created_at = ExpressionWrapper(
+        OuterRef("created_at"), output_field=models.DateTimeField()
+    )
+    rows = (
+        totals.filter(
+            user=OuterRef("user"),
+            category=OuterRef("category"),
+            date__gte=TruncDate(created_at),
+            date__lte=OuterRef("deadline"),
+        )
+        .order_by()
+        .values("user")
+    )
+    canonical = (
+        rows.filter(canonical_unit=OuterRef("canonical_unit"))
+        .annotate(progress=Sum("canonical_total"))
+        .values("progress")
+    )
+    exact = (
+        rows.filter(canonical_unit="", unit=OuterRef("unit"))
+        .annotate(progress=Sum("total"))
+        .values("progress")
+    )
+    goals.update(
+        current_value=Case(
+            When(canonical_unit="", then=Coalesce(Subquery(exact), 0.0)),
+            default=Coalesce(Subquery(canonical), 0.0) / F("unit_multiplier"),
+            output_field=FloatField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("main_app", "0016_backfill_emissions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dailyactivitytotal",
+            name="canonical_total",
+            field=models.FloatField(
+                default=0,
+                help_text="total converted to canonical_unit; 0 when the unit is not recognised",
+            ),
+        ),
+        migrations.AddField(
+            model_name="dailyactivitytotal",
+            name="canonical_unit",
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name="sustainabilitygoal",
+            name="canonical_unit",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="unit's canonical unit; empty when the unit is not recognised",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="sustainabilitygoal",
+            name="unit_multiplier",
+            field=models.FloatField(
+                default=1.0, editable=False, help_text="canonical units per unit"
+            ),
+        ),
+        migrations.RunPython(backfill_canonical_progress, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,192 @@
-from django.db import models
+from datetime import timedelta
+
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import Case, Count, ExpressionWrapper, F, OuterRef, Subquery, Sum, When
+from django.db.models.functions import Coalesce, TruncDate
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.urls import reverse
 from django.core.validators import MinValueValidator
 import stripe
+from . import analytics, emissions
+from .caching import invalidate_dashboards
+
+# Fields that feed DailyActivityTotal; writes touching any of them must
+# move the affected values between rollup rows.
+ROLLUP_FIELDS = frozenset(['user', 'user_id', 'category', 'unit', 'date', 'value'])
+
+# Activity fields that canonical_value, canonical_unit and co2e_kg are derived from
+EMISSION_FIELDS = frozenset(['category', 'unit', 'value'])
+EMISSION_COLUMNS = frozenset(['canonical_value', 'canonical_unit', 'co2e_kg'])
+
+# Goal fields that decide which activities count towards its progress
+PROGRESS_FIELDS = frozenset(['user', 'user_id', 'category', 'unit', 'created_at', 'deadline', 'current_value'])
+
+# Goal columns derived from its unit
+GOAL_UNIT_COLUMNS = frozenset(['canonical_unit', 'unit_multiplier'])
+
+# Goal fields that decide when its next reminder is due
+REMINDER_FIELDS = frozenset(['reminder_frequency', 'last_reminder_sent', 'created_at'])
+
+
+def _chunked(items, size=500):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _add_rollup_delta(deltas, key, total, count, co2e_kg, canonical_total):
+    previous = deltas.get(key, (0.0, 0, 0.0, 0.0))
+    deltas[key] = (previous[0] + total, previous[1] + count, previous[2] + co2e_kg, previous[3] + canonical_total)
+
+
+def _add_row_delta(deltas, row, sign=1):
+    key = (row['user_id'], row['category'], row['unit'], row['date'])
+    _add_rollup_delta(
+        deltas, key, sign * row['value'], sign,
+        sign * (row['co2e_kg'] or 0.0), sign * (row['canonical_value'] or 0.0),
+    )
+
+
+def _add_instance_delta(deltas, activity, sign=1):
+    date = EcoActivity._meta.get_field('date').to_python(activity.date)
+    key = (activity.user_id, activity.category, activity.unit, date)
+    _add_rollup_delta(
+        deltas, key, sign * float(activity.value), sign,
+        sign * (activity.co2e_kg or 0.0), sign * (activity.canonical_value or 0.0),
+    )
+
+
+def parse_tags(text):
+    """Split a comma-separated tag string into unique, lower-cased tag names"""
+    names = (name.strip().lower()[:50] for name in (text or '').split(','))
+    return sorted({name for name in names if name})
+
+
+def sync_activity_tags(tags_by_activity, using='default'):
+    """Replace the ActivityTag links of {activity_id: tags string} with the parsed tags"""
+    if not tags_by_activity:
+        return
+    parsed = {pk: parse_tags(tags) for pk, tags in tags_by_activity.items()}
+    tag_ids = Tag.objects.using(using).ensure({name for names in parsed.values() for name in names})
+    links = ActivityTag.objects.using(using)
+    for chunk in _chunked(list(parsed)):
+        links.filter(activity_id__in=chunk).delete()
+    links.bulk_create(
+        [ActivityTag(activity_id=pk, tag_id=tag_ids[name]) for pk, names in parsed.items() for name in names],
+        batch_size=1000,
+    )
+
+
+def _apply_deltas(deltas, using):
+    """Move the daily rollup and goal progress by the same activity deltas"""
+    DailyActivityTotal.objects.using(using).apply_deltas(deltas)
+    SustainabilityGoal.objects.using(using).apply_activity_deltas(deltas)
+    analytics.invalidate_series(deltas)
+
+
+def progress_subquery(model, value_field, canonical_value_field):
+    """
+    Progress of the outer goal, in its own unit, summed over the rows of model.
+
+    Recognised units match on canonical_unit whatever their spelling, summing
+    canonical_value_field; any other unit only matches rows with the same unit.
+    """
+    created_at = ExpressionWrapper(OuterRef('created_at'), output_field=models.DateTimeField())
+    rows = model.objects.filter(
+        user=OuterRef('user'),
+        category=OuterRef('category'),
+        date__gte=TruncDate(created_at),
+        date__lte=OuterRef('deadline'),
+    ).order_by().values('user')
+    canonical = rows.filter(canonical_unit=OuterRef('canonical_unit')).annotate(
+        progress=Sum(canonical_value_field)
+    ).values('progress')
+    exact = rows.filter(canonical_unit='', unit=OuterRef('unit')).annotate(progress=Sum(value_field)).values('progress')
+    return Case(
+        When(canonical_unit='', then=Coalesce(Subquery(exact), 0.0)),
+        default=Coalesce(Subquery(canonical), 0.0) / F('unit_multiplier'),
+        output_field=models.FloatField(),
+    )
+
+
+def _refresh_goal_units(goals):
+    """Set canonical_unit and unit_multiplier from unit, one UPDATE per distinct unit"""
+    for unit in list(goals.order_by().values_list('unit', flat=True).distinct()):
+        canonical_unit, multiplier = emissions.resolve_unit(unit)
+        goals.filter(unit=unit).update(canonical_unit=canonical_unit, unit_multiplier=multiplier or 1.0)
+
+
+def _add_queryset_deltas(deltas, queryset, sign=1):
+    rows = queryset.order_by().values('user_id', 'category', 'unit', 'date').annotate(
+        total=Sum('value'), activity_count=Count('pk'), co2e_kg=Sum('co2e_kg'), canonical_total=Sum('canonical_value'),
+    )
+    for row in rows:
+        key = (row['user_id'], row['category'], row['unit'], row['date'])
+        _add_rollup_delta(
+            deltas, key, sign * row['total'], sign * row['activity_count'],
+            sign * (row['co2e_kg'] or 0.0), sign * (row['canonical_total'] or 0.0),
+        )
+
+
+class EcoActivityQuerySet(models.QuerySet):
+    """QuerySet that keeps DailyActivityTotal and cached dashboards in step with bulk writes"""
+
+    def _user_ids(self):
+        return set(self.order_by().values_list('user_id', flat=True).distinct())
+
+    def with_tag(self, name):
+        """Activities carrying a tag, found through the indexed tag link table"""
+        names = parse_tags(name)
+        if not names:
+            return self.none()
+        return self.filter(tag_links__tag__name=names[0])
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db):
+            user_ids = self._user_ids()
+            needs_pks = 'tags' in kwargs or ROLLUP_FIELDS.intersection(kwargs)
+            pks = list(self.values_list('pk', flat=True)) if needs_pks else []
+            base = self.model._base_manager.using(self.db)
+            if not ROLLUP_FIELDS.intersection(kwargs):
+                rows = super().update(**kwargs)
+            else:
+                deltas = {}
+                _add_queryset_deltas(deltas, self, sign=-1)
+                rows = super().update(**kwargs)
+                for chunk in _chunked(pks):
+                    if EMISSION_FIELDS.intersection(kwargs) and not EMISSION_COLUMNS.intersection(kwargs):
+                        emissions.refresh_activity_emissions(base.filter(pk__in=chunk))
+                    _add_queryset_deltas(deltas, base.filter(pk__in=chunk))
+                _apply_deltas(deltas, self.db)
+                user_ids.update(key[0] for key in deltas)
+            if 'tags' in kwargs:
+                for chunk in _chunked(pks):
+                    sync_activity_tags(dict(base.filter(pk__in=chunk).values_list('pk', 'tags')), self.db)
+            invalidate_dashboards(user_ids)
+        return rows
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            deltas = {}
+            _add_queryset_deltas(deltas, self, sign=-1)
+            result = super().delete()
+            _apply_deltas(deltas, self.db)
+            invalidate_dashboards(key[0] for key in deltas)
+        return result
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        emissions.annotate_activities(objs)
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            deltas = {}
+            for obj in objs:
+                _add_instance_delta(deltas, obj)
+            _apply_deltas(deltas, self.db)
+            sync_activity_tags({obj.pk: obj.tags for obj in objs if obj.pk and obj.tags}, self.db)
+            invalidate_dashboards(key[0] for key in deltas)
+        return objs
+
 
 class EcoActivity(models.Model):
     CATEGORY_CHOICES = [
@@ -45,6 +228,28 @@ class EcoActivity(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     location = models.CharField(max_length=255, blank=True)
     tags = models.CharField(max_length=255, blank=True, help_text="Comma-separated tags")
+    canonical_value = models.FloatField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="value converted to canonical_unit; empty when the unit is not recognised"
+    )
+    canonical_unit = models.CharField(max_length=20, blank=True, editable=False)
+    co2e_kg = models.FloatField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Emissions in kg CO2e; empty when no emission factor applies"
+    )
+    tag_set = models.ManyToManyField(
+        'Tag',
+        through='ActivityTag',
+        related_name='activities',
+        blank=True,
+        help_text="Normalized copy of tags, kept in sync on save"
+    )
+
+    objects = EcoActivityQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.user.username} - {self.category} ({self.value} {self.unit})"
@@ -52,14 +257,314 @@ class EcoActivity(models.Model):
     def get_absolute_url(self):
         return reverse('admin:main_app_ecoactivity_change', args=[self.id])
 
+    def _stored_row(self, using):
+        """The rollup and tag fields of this activity as currently stored in the database"""
+        return EcoActivity._base_manager.using(using).select_for_update().filter(
+            pk=self.pk
+        ).values('user_id', 'category', 'unit', 'date', 'value', 'co2e_kg', 'canonical_value', 'tags').first()
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not ROLLUP_FIELDS.union(['tags']).intersection(update_fields):
+            return super().save(*args, **kwargs)
+
+        emissions.annotate_activities([self])
+        if update_fields is not None and EMISSION_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = set(update_fields) | EMISSION_COLUMNS
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            deltas = {}
+            stored = self._stored_row(using) if self.pk is not None else None
+            if stored:
+                _add_row_delta(deltas, stored, sign=-1)
+            super().save(*args, **kwargs)
+            _add_instance_delta(deltas, self)
+            _apply_deltas(deltas, using)
+            if (stored['tags'] if stored else '') != self.tags:
+                sync_activity_tags({self.pk: self.tags}, using)
+
+    def delete(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            deltas = {}
+            stored = self._stored_row(using)
+            if stored:
+                _add_row_delta(deltas, stored, sign=-1)
+            result = super().delete(*args, **kwargs)
+            _apply_deltas(deltas, using)
+        return result
+
     class Meta:
         verbose_name_plural = "Eco Activities"
         ordering = ['-date']
         indexes = [
             models.Index(fields=['user', 'category', 'date']),
             models.Index(fields=['verified', 'impact_level']),
+            # Keyset pagination over (-date, -id) for one user
+            models.Index(fields=['user', 'date', 'id']),
+            # Emission reports sum co2e_kg over a user's date range from the index alone
+            models.Index(fields=['user', 'date', 'co2e_kg']),
+        ]
+
+
+class TagQuerySet(models.QuerySet):
+    def ensure(self, names):
+        """Create any missing tags and return {name: id} for all of them"""
+        names = set(names)
+        if not names:
+            return {}
+        self.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+        tag_ids = {}
+        for chunk in _chunked(sorted(names)):
+            tag_ids.update(self.filter(name__in=chunk).values_list('name', 'pk'))
+        return tag_ids
+
+    def with_activity_counts(self, user=None):
+        """Tags annotated with how many activities (optionally of one user) carry them"""
+        queryset = self
+        if user is not None:
+            queryset = queryset.filter(activity_links__activity__user=user)
+        return queryset.annotate(activity_count=Count('activity_links')).order_by('-activity_count', 'name')
+
+
+class Tag(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+
+    objects = TagQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+
+
+class ActivityTag(models.Model):
+    activity = models.ForeignKey(EcoActivity, on_delete=models.CASCADE, related_name='tag_links')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='activity_links')
+
+    def __str__(self):
+        return f"{self.activity_id} - {self.tag_id}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['activity', 'tag'], name='unique_activity_tag'),
+        ]
+        indexes = [
+            # "Activities with tag X" walks this index instead of scanning tags strings
+            models.Index(fields=['tag', 'activity']),
         ]
 
+
+class DailyActivityTotalQuerySet(models.QuerySet):
+    def for_period(self, user, start=None, end=None):
+        """Rollup rows for a user between two dates (inclusive)"""
+        queryset = self.filter(user=user)
+        if start:
+            queryset = queryset.filter(date__gte=start)
+        if end:
+            queryset = queryset.filter(date__lte=end)
+        return queryset
+
+    def category_totals(self):
+        """kg CO2e and activity count per category; raw totals would add up different units"""
+        return self.values('category').annotate(
+            co2e_kg=Sum('co2e_kg'), activity_count=Sum('activity_count')
+        ).order_by('category')
+
+    def apply_deltas(self, deltas):
+        """
+        Add {(user_id, category, unit, date): (total, count, co2e_kg, canonical_total)} deltas to the rollup.
+
+        co2e_kg and canonical_total come from the activities' stored figures, not
+        the current factors, so removing an activity takes back exactly what adding it put in.
+        """
+        for (user_id, category, unit, date), (total, count, co2e_kg, canonical_total) in deltas.items():
+            if not total and not count and not co2e_kg and not canonical_total:
+                continue
+            key = {'user_id': user_id, 'category': category, 'unit': unit, 'date': date}
+            changes = {
+                'total': F('total') + total,
+                'activity_count': F('activity_count') + count,
+                'co2e_kg': F('co2e_kg') + co2e_kg,
+                'canonical_total': F('canonical_total') + canonical_total,
+            }
+            if not self.filter(**key).update(**changes):
+                try:
+                    with transaction.atomic(using=self.db):
+                        self.create(
+                            total=total, activity_count=count, co2e_kg=co2e_kg, canonical_total=canonical_total,
+                            canonical_unit=emissions.resolve_unit(unit)[0], **key
+                        )
+                except IntegrityError:
+                    # Another writer created the row first
+                    self.filter(**key).update(**changes)
+            if count < 0:
+                self.filter(activity_count__lte=0, **key).delete()
+
+
+class DailyActivityTotal(models.Model):
+    """Per-day activity totals, maintained on every EcoActivity write"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    category = models.CharField(max_length=20, choices=EcoActivity.CATEGORY_CHOICES)
+    unit = models.CharField(max_length=20)
+    date = models.DateField()
+    total = models.FloatField(default=0)
+    activity_count = models.IntegerField(default=0)
+    co2e_kg = models.FloatField(default=0, help_text="total in kg CO2e, at the emission factor in force when written")
+    canonical_unit = models.CharField(max_length=20, blank=True, editable=False)
+    canonical_total = models.FloatField(
+        default=0, help_text="total converted to canonical_unit; 0 when the unit is not recognised"
+    )
+
+    objects = DailyActivityTotalQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.user.username} - {self.category} on {self.date} ({self.total} {self.unit})"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'category', 'unit', 'date'],
+                name='unique_daily_activity_total',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date']),
+        ]
+
+
+class EmissionFactor(models.Model):
+    """kg CO2e per canonical unit of an activity category (see main_app.emissions)"""
+    category = models.CharField(max_length=20, choices=EcoActivity.CATEGORY_CHOICES)
+    unit = models.CharField(max_length=20, help_text="Canonical unit: kwh, l, km or kg")
+    kg_co2e_per_unit = models.FloatField(validators=[MinValueValidator(0.0)])
+    source = models.CharField(max_length=255, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.category}: {self.kg_co2e_per_unit} kg CO2e/{self.unit}"
+
+    class Meta:
+        ordering = ['category', 'unit']
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'unit'], name='unique_emission_factor'),
+        ]
+
+class TableRowCount(models.Model):
+    """Row counters kept current by SQLite triggers (see main_app.rowcounts)"""
+    table_name = models.CharField(max_length=100, unique=True)
+    row_count = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.table_name}: {self.row_count} rows"
+
+class SustainabilityGoalQuerySet(models.QuerySet):
+    """QuerySet that drops cached dashboards on bulk writes, which skip signals"""
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db):
+            user_ids = set(self.order_by().values_list('user_id', flat=True).distinct())
+            relabel = 'unit' in kwargs and not GOAL_UNIT_COLUMNS.intersection(kwargs)
+            recount = PROGRESS_FIELDS.intersection(kwargs) and 'current_value' not in kwargs
+            reschedule = REMINDER_FIELDS.intersection(kwargs) and 'next_reminder_at' not in kwargs
+            # Read the rows before the UPDATE, which may change the fields self filters on
+            pks = list(self.values_list('pk', flat=True)) if relabel or recount or reschedule else []
+            rows = super().update(**kwargs)
+            for chunk in _chunked(pks):
+                if relabel:
+                    _refresh_goal_units(self.model._base_manager.using(self.db).filter(pk__in=chunk))
+                if recount:
+                    self.model._base_manager.using(self.db).filter(pk__in=chunk).update(
+                        current_value=progress_subquery(DailyActivityTotal, 'total', 'canonical_total')
+                    )
+                if reschedule:
+                    self.model.objects.using(self.db).filter(pk__in=chunk).schedule_reminders()
+            invalidate_dashboards(user_ids)
+        return rows
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            user_ids = set(self.order_by().values_list('user_id', flat=True).distinct())
+            result = super().delete()
+            invalidate_dashboards(user_ids)
+        return result
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.next_reminder_at = obj.get_next_reminder_at()
+            obj.set_canonical_unit()
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            pks = [obj.pk for obj in objs if obj.pk]
+            for chunk in _chunked(pks):
+                self.model._base_manager.using(self.db).filter(pk__in=chunk).update(
+                    current_value=progress_subquery(DailyActivityTotal, 'total', 'canonical_total')
+                )
+            invalidate_dashboards(obj.user_id for obj in objs)
+        return objs
+
+    def schedule_reminders(self):
+        """Set next_reminder_at to the last reminder (or creation) plus reminder_frequency days"""
+        rows = 0
+        base = self.model._base_manager.using(self.db)
+        frequencies = self.order_by().values_list('reminder_frequency', flat=True).distinct()
+        for frequency in list(frequencies):
+            goals = base.filter(pk__in=self.filter(reminder_frequency=frequency).values('pk'))
+            if frequency <= 0:
+                rows += goals.update(next_reminder_at=None)
+            else:
+                rows += goals.update(
+                    next_reminder_at=Coalesce('last_reminder_sent', 'created_at') + timedelta(days=frequency)
+                )
+        return rows
+
+    def mark_overdue(self, today=None, batch_size=5000):
+        """Flip open goals past their deadline to OVERDUE in batches; returns rows changed"""
+        today = today or timezone.now().date()
+        due = self.filter(status__in=SustainabilityGoal.OPEN_STATUSES, deadline__lt=today)
+        changed = 0
+        while True:
+            with transaction.atomic(using=self.db):
+                pks = list(due.order_by().values_list('pk', flat=True)[:batch_size])
+                if not pks:
+                    return changed
+                changed += due.filter(pk__in=pks).update(status='OVERDUE')
+
+    def apply_activity_deltas(self, deltas):
+        """
+        Add rollup deltas to every goal whose user, category, unit and date window they fall in.
+
+        Units match as in progress_subquery: recognised ones on their canonical
+        unit, scaled into the goal's unit, anything else on the exact unit.
+        """
+        changes = {}
+        for (user_id, category, unit, date), (total, _, _, canonical_total) in deltas.items():
+            canonical_unit, _ = emissions.resolve_unit(unit)
+            if canonical_unit:
+                key, amount = (user_id, category, canonical_unit, None), canonical_total
+            else:
+                key, amount = (user_id, category, '', unit), total
+            if amount:
+                changes.setdefault(key, []).append((date, amount))
+        base = self.model._base_manager.using(self.db)
+        for (user_id, category, canonical_unit, unit), dated_totals in changes.items():
+            goals = base.filter(
+                user_id=user_id, category=category, canonical_unit=canonical_unit,
+                deadline__gte=min(date for date, total in dated_totals),
+            )
+            if not canonical_unit:
+                goals = goals.filter(unit=unit)
+            for pk, created_at, deadline, multiplier in goals.values_list(
+                'pk', 'created_at', 'deadline', 'unit_multiplier'
+            ):
+                start = timezone.localdate(created_at)
+                delta = sum(total for date, total in dated_totals if start <= date <= deadline)
+                if delta:
+                    base.filter(pk=pk).update(current_value=F('current_value') + delta / multiplier)
+
+
 class SustainabilityGoal(models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
@@ -69,6 +574,9 @@ class SustainabilityGoal(models.Model):
         ('OVERDUE', 'Overdue'),
     ]
 
+    # Statuses that still expect progress; everything else is settled
+    OPEN_STATUSES = ['PENDING', 'IN_PROGRESS']
+
     PRIORITY_CHOICES = [
         ('LOW', 'Low Priority'),
         ('MEDIUM', 'Medium Priority'),
@@ -82,6 +590,13 @@ class SustainabilityGoal(models.Model):
     target_value = models.FloatField(validators=[MinValueValidator(0.0)])
     current_value = models.FloatField(default=0, validators=[MinValueValidator(0.0)])
     unit = models.CharField(max_length=20)
+    canonical_unit = models.CharField(
+        max_length=20,
+        blank=True,
+        editable=False,
+        help_text="unit's canonical unit; empty when the unit is not recognised"
+    )
+    unit_multiplier = models.FloatField(default=1.0, editable=False, help_text="canonical units per unit")
     deadline = models.DateField()
     status = models.CharField(
         max_length=20, 
@@ -100,6 +615,12 @@ class SustainabilityGoal(models.Model):
         help_text="Reminder frequency in days"
     )
     last_reminder_sent = models.DateTimeField(null=True, blank=True)
+    next_reminder_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="When the next reminder is due, kept in step with reminder_frequency"
+    )
     notes = models.TextField(blank=True)
     category = models.CharField(
         max_length=20,
@@ -115,6 +636,8 @@ class SustainabilityGoal(models.Model):
         related_name='assigned_goals'
     )
 
+    objects = SustainabilityGoalQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.username} - {self.title}"
 
@@ -141,16 +664,56 @@ class SustainabilityGoal(models.Model):
     def is_overdue(self):
         return self.deadline < timezone.now().date() and self.status not in ['COMPLETED', 'CANCELLED']
 
+    def get_next_reminder_at(self):
+        """When the next reminder is due, or None when reminders are off"""
+        if self.reminder_frequency <= 0:
+            return None
+        return (self.last_reminder_sent or self.created_at) + timedelta(days=self.reminder_frequency)
+
+    def set_canonical_unit(self):
+        """Set canonical_unit and unit_multiplier from unit"""
+        self.canonical_unit, multiplier = emissions.resolve_unit(self.unit)
+        self.unit_multiplier = multiplier or 1.0
+
     def save(self, *args, **kwargs):
         if self.is_overdue() and self.status not in ['COMPLETED', 'CANCELLED']:
             self.status = 'OVERDUE'
-        super().save(*args, **kwargs)
+        self.next_reminder_at = self.get_next_reminder_at()
+        self.set_canonical_unit()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and REMINDER_FIELDS.intersection(update_fields):
+            update_fields = kwargs['update_fields'] = set(update_fields) | {'next_reminder_at'}
+        if update_fields is not None and 'unit' in update_fields:
+            update_fields = kwargs['update_fields'] = set(update_fields) | GOAL_UNIT_COLUMNS
+        if update_fields is not None and not PROGRESS_FIELDS.intersection(update_fields):
+            return super().save(*args, **kwargs)
+
+        # current_value is owned by the progress engine: recount it from the
+        # rollup in the same statement, so a stale in-memory value never wins
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            progress = type(self)._base_manager.using(using).filter(pk=self.pk)
+            progress.update(current_value=progress_subquery(DailyActivityTotal, 'total', 'canonical_total'))
+            self.current_value = progress.values_list('current_value', flat=True).get()
 
     class Meta:
         ordering = ['deadline']
         indexes = [
             models.Index(fields=['user', 'status', 'deadline']),
             models.Index(fields=['priority', 'category']),
+            # Only open goals can become overdue, so the sweep scans just those
+            models.Index(
+                fields=['deadline'],
+                condition=models.Q(status__in=['PENDING', 'IN_PROGRESS']),
+                name='goal_open_deadline_idx',
+            ),
+            # Due reminders are looked up by time, again only among open goals
+            models.Index(
+                fields=['next_reminder_at'],
+                condition=models.Q(status__in=['PENDING', 'IN_PROGRESS']),
+                name='goal_reminder_due_idx',
+            ),
         ]
 
 class SubscriptionPlan(models.Model):
@@ -169,6 +732,39 @@ class SubscriptionPlan(models.Model):
     def __str__(self):
         return f"{self.name} (${self.price}/{self.billing_cycle})"
 
+    def get_feature_list(self):
+        """features text as a list, one entry per non-empty line without its leading dash"""
+        features = (line.strip('- ').strip() for line in self.features.strip().split('\n'))
+        return [feature for feature in features if feature]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_pricing = (instance.__dict__.get('price'), instance.__dict__.get('billing_cycle'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Stripe Prices are immutable: a new amount or interval needs a new Price
+        loaded = getattr(self, '_loaded_pricing', None)
+        if self.stripe_price_id and loaded and loaded != (self.price, self.billing_cycle):
+            self.stripe_price_id = None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'stripe_price_id'}
+        super().save(*args, **kwargs)
+        self._loaded_pricing = (self.price, self.billing_cycle)
+
+class UserSubscriptionQuerySet(models.QuerySet):
+    def expire(self, now=None):
+        """Deactivate active subscriptions past their end_date in one UPDATE; returns rows changed"""
+        from .entitlements import invalidate_entitlements
+        expired = self.filter(is_active=True, end_date__lte=now or timezone.now())
+        with transaction.atomic(using=self.db):
+            user_ids = list(expired.values_list('user_id', flat=True))
+            rows = expired.update(is_active=False)
+            invalidate_entitlements(user_ids)
+        return rows
+
+
 class UserSubscription(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     plan = models.ForeignKey(SubscriptionPlan, on_delete=models.PROTECT)
@@ -179,6 +775,8 @@ class UserSubscription(models.Model):
     stripe_subscription_id = models.CharField(max_length=100, blank=True, null=True)
     stripe_customer_id = models.CharField(max_length=100, blank=True, null=True)
 
+    objects = UserSubscriptionQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.username}'s {self.plan.name} Subscription"
 
@@ -191,7 +789,58 @@ class UserSubscription(models.Model):
         if self.stripe_subscription_id:
             try:
                 stripe.Subscription.delete(self.stripe_subscription_id)
+            except stripe.error.APIConnectionError:
+                # Stripe unreachable (or circuit open): keep the subscription active
+                # rather than stop tracking one that is still being billed
+                raise
             except stripe.error.StripeError:
                 pass
         self.is_active = False
         self.save()
+
+    class Meta:
+        indexes = [
+            # Expiry sweep: only active rows are candidates
+            models.Index(
+                fields=['end_date'],
+                condition=models.Q(is_active=True),
+                name='subscription_active_end_idx',
+            ),
+            # Webhooks and the Stripe sync look rows up by Stripe id
+            models.Index(fields=['stripe_subscription_id']),
+        ]
+
+
+class StripeEventQuerySet(models.QuerySet):
+    def pending(self, max_attempts=None):
+        """Events still waiting to be processed, oldest first"""
+        queryset = self.filter(processed_at__isnull=True)
+        if max_attempts is not None:
+            queryset = queryset.filter(attempts__lt=max_attempts)
+        return queryset.order_by('received_at', 'pk')
+
+
+class StripeEvent(models.Model):
+    """Raw Stripe webhook event, stored on receipt and handled later by process_stripe_events"""
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    objects = StripeEventQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.type} ({self.event_id})"
+
+    class Meta:
+        indexes = [
+            # The worker only ever scans the unprocessed tail of the table
+            models.Index(
+                fields=['received_at'],
+                condition=models.Q(processed_at__isnull=True),
+                name='stripe_event_pending_idx',
+            ),
+        ]
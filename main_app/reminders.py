@@ -0,0 +1,99 @@
+"""
+Goal reminder emails.
+
+Due goals are read in batches from the partial next_reminder_at index,
+rendered, sent over one reused mail connection and stamped in bulk.
+"""
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import SustainabilityGoal
+
+TEMPLATE_NAME = 'main_app/email/goal_reminder.txt'
+
+
+def due_goals(now=None):
+    """Open goals whose next reminder is due, oldest first"""
+    now = now or timezone.now()
+    return SustainabilityGoal.objects.filter(
+        status__in=SustainabilityGoal.OPEN_STATUSES,
+        next_reminder_at__lte=now,
+    ).select_related('user').order_by('next_reminder_at', 'pk')
+
+
+def build_message(goal, template):
+    body = template.render({'goal': goal, 'user': goal.user, 'progress': goal.calculate_progress()})
+    return EmailMessage(
+        subject=f'Reminder: {goal.title}',
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[goal.user.email],
+    )
+
+
+def reschedule(goals, now, sent=True):
+    """Push the goals' next reminder out, with one UPDATE per reminder frequency"""
+    by_frequency = defaultdict(list)
+    for goal in goals:
+        by_frequency[goal.reminder_frequency].append(goal.pk)
+    base = SustainabilityGoal._base_manager
+    for frequency, pks in by_frequency.items():
+        changes = {'next_reminder_at': now + timedelta(days=frequency) if frequency > 0 else None}
+        if sent:
+            changes['last_reminder_sent'] = now
+        base.filter(pk__in=pks).update(**changes)
+
+
+def send_batch(goals, connection, template, now):
+    """
+    Send one batch of reminders and stamp the goals; returns (sent, skipped).
+
+    Goals are only stamped after the backend accepted the batch, so a failed
+    send leaves them due for the next run. Owners without an email address
+    are skipped and simply rescheduled.
+    """
+    recipients = [goal for goal in goals if goal.user.email]
+    skipped = [goal for goal in goals if not goal.user.email]
+    sent = 0
+    if recipients:
+        sent = connection.send_messages([build_message(goal, template) for goal in recipients]) or 0
+    reschedule(recipients, now)
+    reschedule(skipped, now, sent=False)
+    return sent, len(skipped)
+
+
+def send_reminders(goals, now=None):
+    """Send reminders for specific goals right away, whether or not they are due"""
+    goals = list(goals)
+    with get_connection() as connection:
+        return send_batch(goals, connection, get_template(TEMPLATE_NAME), now or timezone.now())
+
+
+def send_due_reminders(batch_size=500, limit=None, now=None, log=None):
+    """Send every due reminder in batches over one reused connection; returns throughput stats"""
+    now = now or timezone.now()
+    template = get_template(TEMPLATE_NAME)
+    stats = {'goals': 0, 'sent': 0, 'skipped': 0}
+    started = time.monotonic()
+    with get_connection() as connection:
+        while limit is None or stats['goals'] < limit:
+            size = batch_size if limit is None else min(batch_size, limit - stats['goals'])
+            # Stamped goals drop out of the due set, so each query returns the next slice
+            goals = list(due_goals(now)[:size])
+            if not goals:
+                break
+            sent, skipped = send_batch(goals, connection, template, now)
+            stats['goals'] += len(goals)
+            stats['sent'] += sent
+            stats['skipped'] += skipped
+            if log:
+                elapsed = time.monotonic() - started
+                log(f"{stats['goals']} goals, {stats['sent']} sent ({stats['goals'] / elapsed:.0f} goals/s)")
+    stats['elapsed'] = time.monotonic() - started
+    return stats
@@ -0,0 +1,84 @@
+"""
+Read-replica routing.
+
+Reads go to the 'replica' database only inside replica_reads() (or a view
+marked with use_replica, see ReplicaRoutingMiddleware); everything else,
+and every write, stays on 'default'. Without DATABASE_REPLICA_URL there is
+no 'replica' alias and the router is a no-op.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA = 'replica'
+
+# Models whose stale reads would be cached or acted on: sessions and users
+# (login checks the password hash), billing state behind cached
+# entitlements, and the webhook event queue
+PRIMARY_ONLY = frozenset([
+    'sessions.session', 'auth.user', 'main_app.usersubscription', 'main_app.stripeevent',
+])
+
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def start_replica_reads():
+    """Route reads to the replica until reset with the returned token"""
+    return _use_replica.set(True)
+
+
+def stop_replica_reads(token):
+    _use_replica.reset(token)
+
+
+@contextmanager
+def replica_reads():
+    token = start_replica_reads()
+    try:
+        yield
+    finally:
+        stop_replica_reads(token)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary even inside replica_reads().
+
+    For values stored in a shared cache: filled from a lagging replica, they
+    would outlive the lag under the generation bumped by the write.
+    """
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def use_replica(view_func):
+    """Mark a view whose GET and HEAD requests may read from the replica"""
+    view_func.use_replica = True
+    return view_func
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not replica_configured():
+            return None
+        # Explicit even outside replica_reads(), so an object loaded from the
+        # replica doesn't drag its later related lookups there with it
+        if not _use_replica.get() or model._meta.label_lower in PRIMARY_ONLY:
+            return 'default'
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data, so objects read from either may be related
+        return True
@@ -0,0 +1,91 @@
+"""
+Cheap row-count estimates for large tables.
+
+PostgreSQL keeps a planner estimate in pg_class.reltuples. SQLite has no
+equivalent, so TableRowCount holds counters that triggers maintain inside
+every INSERT/DELETE transaction.
+"""
+from django.apps import apps
+from django.db import connections, transaction
+
+TRACKED_MODELS = ('main_app.EcoActivity', 'main_app.SustainabilityGoal')
+
+
+def install_sqlite_counters(using='default'):
+    """
+    Create the counting triggers and seed each counter with an exact count.
+
+    Idempotent. Run after every migrate, since SQLite drops a table's triggers
+    whenever a migration rebuilds that table.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    TableRowCount = apps.get_model('main_app', 'TableRowCount')
+    counter_table = TableRowCount._meta.db_table
+    if counter_table not in connection.introspection.table_names():
+        return
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for label in TRACKED_MODELS:
+            table = apps.get_model(label)._meta.db_table
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s)",
+                [f'{table}_count_insert', f'{table}_count_delete'],
+            )
+            if cursor.fetchone()[0] == 2:
+                continue
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {table}_count_insert AFTER INSERT ON {table} BEGIN '
+                f"UPDATE {counter_table} SET row_count = row_count + 1 WHERE table_name = '{table}'; END"
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {table}_count_delete AFTER DELETE ON {table} BEGIN '
+                f"UPDATE {counter_table} SET row_count = row_count - 1 WHERE table_name = '{table}'; END"
+            )
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            TableRowCount.objects.using(using).update_or_create(
+                table_name=table, defaults={'row_count': cursor.fetchone()[0]}
+            )
+
+
+def remove_sqlite_counters(using='default'):
+    """
+    Drop the counting triggers and their counters, which would otherwise go stale.
+
+    install_sqlite_counters reseeds the counters if the triggers come back.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    TableRowCount = apps.get_model('main_app', 'TableRowCount')
+    if TableRowCount._meta.db_table not in connection.introspection.table_names():
+        return
+
+    tables = [apps.get_model(label)._meta.db_table for label in TRACKED_MODELS]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_count_insert')
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table}_count_delete')
+        TableRowCount.objects.using(using).filter(table_name__in=tables).delete()
+
+
+def estimate_row_count(model, using='default'):
+    """Approximate number of rows in model's table, or None when no estimate is available"""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [connection.ops.quote_name(table)],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 until the table has been vacuumed or analyzed
+        return row[0] if row and row[0] >= 0 else None
+    if connection.vendor == 'sqlite':
+        TableRowCount = apps.get_model('main_app', 'TableRowCount')
+        return TableRowCount.objects.using(using).filter(
+            table_name=table
+        ).values_list('row_count', flat=True).first()
+    return None
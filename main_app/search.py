@@ -0,0 +1,149 @@
+"""
+Full-text search over activity descriptions, notes, locations and tags.
+
+SQLite uses an FTS5 external-content table kept in sync by triggers.
+PostgreSQL uses a generated tsvector column with a GIN index (migration
+0010). Other databases fall back to icontains.
+"""
+import re
+
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import Case, Q, Subquery, When
+from django.db.models.expressions import RawSQL
+
+from .models import EcoActivity
+
+FTS_TABLE = 'main_app_ecoactivity_fts'
+FTS_COLUMNS = ('description', 'notes', 'location', 'tags')
+# bm25 column weights, in FTS_COLUMNS order; mirrors the setweight() classes on PostgreSQL
+FTS_WEIGHTS = (4.0, 1.0, 2.0, 3.0)
+TRIGGER_NAMES = [f'{FTS_TABLE}_insert', f'{FTS_TABLE}_delete', f'{FTS_TABLE}_update']
+
+
+def install_sqlite_fts(using='default'):
+    """
+    Create the FTS5 table and its sync triggers, then index existing rows.
+
+    Idempotent. Run after every migrate, since SQLite drops a table's triggers
+    whenever a migration rebuilds that table.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    table = EcoActivity._meta.db_table
+    if table not in connection.introspection.table_names():
+        return
+
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+            [FTS_TABLE, *TRIGGER_NAMES],
+        )
+        if cursor.fetchone()[0] == 4:
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"{columns}, content='{table}', content_rowid='id')"
+        )
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {table} BEGIN '
+            f'INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); END'
+        )
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {table} BEGIN '
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END"
+        )
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF {columns} ON {table} BEGIN '
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+            f'INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); END'
+        )
+        # Rows written while the triggers were missing are picked up here
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+# Every term must match, and each one also matches as a prefix ("sol" finds "solar")
+def _fts5_query(terms):
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _tsquery(terms):
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def _match_sql(vendor, terms):
+    """SQL selecting matching activity ids, or None when the database has no full-text index"""
+    if vendor == 'sqlite':
+        return f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', _fts5_query(terms)
+    if vendor == 'postgresql':
+        return (
+            f"SELECT id FROM {EcoActivity._meta.db_table} "
+            f"WHERE search_vector @@ to_tsquery('simple', %s)"
+        ), _tsquery(terms)
+    return None, None
+
+
+def filter_activities(queryset, query):
+    """Restrict queryset to activities matching every term of query"""
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    sql, param = _match_sql(connections[queryset.db].vendor, terms)
+    if sql is None:
+        for term in terms:
+            queryset = queryset.filter(
+                Q(description__icontains=term) | Q(notes__icontains=term)
+                | Q(location__icontains=term) | Q(tags__icontains=term)
+            )
+        return queryset
+    return queryset.filter(pk__in=RawSQL(sql, [param]))
+
+
+def admin_search(queryset, query):
+    """Full-text match, or an exact username (both index lookups rather than a scan)"""
+    usernames = User.objects.filter(username=query.strip()).values('pk')
+    return queryset.filter(
+        Q(pk__in=filter_activities(queryset, query).values('pk')) | Q(user_id__in=Subquery(usernames))
+    )
+
+
+def ranked_activities(user, query, limit=50):
+    """The user's best-matching activities, most relevant first"""
+    terms = search_terms(query)
+    if not terms:
+        return []
+    using = router.db_for_read(EcoActivity)
+    connection = connections[using]
+    table = EcoActivity._meta.db_table
+    if connection.vendor == 'sqlite':
+        sql = (
+            f'SELECT a.id FROM {FTS_TABLE} f JOIN {table} a ON a.id = f.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s AND a.user_id = %s '
+            f'ORDER BY bm25({FTS_TABLE}, {", ".join(map(str, FTS_WEIGHTS))}) LIMIT %s'
+        )
+        params = [_fts5_query(terms), user.pk, limit]
+    elif connection.vendor == 'postgresql':
+        tsquery = _tsquery(terms)
+        sql = (
+            f"SELECT id FROM {table} WHERE user_id = %s AND search_vector @@ to_tsquery('simple', %s) "
+            f"ORDER BY ts_rank(search_vector, to_tsquery('simple', %s)) DESC LIMIT %s"
+        )
+        params = [user.pk, tsquery, tsquery, limit]
+    else:
+        return list(filter_activities(EcoActivity.objects.filter(user=user), query)[:limit])
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        return []
+    order = Case(*[When(pk=pk, then=position) for position, pk in enumerate(ids)])
+    return list(EcoActivity.objects.using(using).filter(pk__in=ids).order_by(order))
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import emissions, rowcounts, search
+from .caching import invalidate_dashboards, invalidate_plans
+from .entitlements import invalidate_entitlements
+from .models import EcoActivity, EmissionFactor, SustainabilityGoal, SubscriptionPlan, UserSubscription
+
+
+@receiver(post_save, sender=EcoActivity)
+@receiver(post_delete, sender=EcoActivity)
+@receiver(post_save, sender=SustainabilityGoal)
+@receiver(post_delete, sender=SustainabilityGoal)
+def invalidate_owner_dashboard(sender, instance, **kwargs):
+    invalidate_dashboards([instance.user_id])
+
+
+@receiver(post_save, sender=SubscriptionPlan)
+@receiver(post_delete, sender=SubscriptionPlan)
+def invalidate_plan_cache(sender, **kwargs):
+    invalidate_plans()
+
+
+@receiver(post_save, sender=EmissionFactor)
+@receiver(post_delete, sender=EmissionFactor)
+def invalidate_emission_factors(sender, **kwargs):
+    emissions.invalidate_factors()
+
+
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+def invalidate_subscriber_entitlement(sender, instance, **kwargs):
+    invalidate_entitlements([instance.user_id])
+
+def install_row_counters(sender, using, **kwargs):
+    # The triggers add a write to every insert and delete; only pay for them when they're read
+    if getattr(settings, 'ADMIN_APPROXIMATE_COUNTS', False):
+        rowcounts.install_sqlite_counters(using)
+    else:
+        rowcounts.remove_sqlite_counters(using)
+
+
+def install_search_index(sender, using, **kwargs):
+    search.install_sqlite_fts(using)
@@ -0,0 +1,123 @@
+"""
+Shared Stripe HTTP client: pooled keep-alive connections, strict timeouts,
+bounded retries and a circuit breaker shared by every worker via the cache.
+
+configure() installs it as stripe.default_http_client at startup, so every
+stripe.* call in the project goes through it.
+"""
+import time
+
+import requests
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from stripe.http_client import RequestsClient
+
+from . import metrics
+
+REQUESTS = 'stripe.requests'
+ERRORS = 'stripe.errors'
+LATENCY_MS = 'stripe.latency_ms'
+REJECTED = 'stripe.rejected'
+CIRCUIT_OPENED = 'stripe.circuit_opened'
+metrics.register(REQUESTS, ERRORS, LATENCY_MS, REJECTED, CIRCUIT_OPENED)
+
+
+class StripeUnavailable(stripe.error.APIConnectionError):
+    """Raised without a network call while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for `cooldown` seconds.
+
+    After the cooldown the breaker is half-open: the one caller that takes the
+    probe lock is let through and everyone else is still rejected. If the probe
+    fails the breaker opens again straight away, if it succeeds it closes.
+    """
+
+    def __init__(self, name, threshold, cooldown):
+        self.failures_key = f'breaker:{name}:failures'
+        self.open_key = f'breaker:{name}:open'
+        self.tripped_key = f'breaker:{name}:tripped'
+        self.probe_key = f'breaker:{name}:probe'
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+    def allow_request(self):
+        if cache.get(self.open_key) is not None:
+            return False
+        if cache.get(self.tripped_key) is None:
+            return True
+        # Half-open; the lock expires after a cooldown in case the probe never reports back
+        return cache.add(self.probe_key, 1, self.cooldown)
+
+    def record_success(self):
+        cache.delete_many([self.failures_key, self.tripped_key, self.probe_key])
+
+    def record_failure(self):
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            failures = 1 if cache.add(self.failures_key, 1, self.cooldown) else cache.incr(self.failures_key)
+        if failures >= self.threshold:
+            cache.set(self.open_key, 1, self.cooldown)
+            # Leave the count one short of the threshold: the first call after the
+            # cooldown reopens the breaker if it fails
+            cache.set(self.failures_key, self.threshold - 1, self.cooldown * 2)
+            cache.set(self.tripped_key, 1, self.cooldown * 2)
+            cache.delete(self.probe_key)
+            metrics.incr(CIRCUIT_OPENED)
+
+
+class PooledStripeClient(RequestsClient):
+    """RequestsClient over one pooled Session, with metrics and a circuit breaker"""
+
+    def __init__(self, timeout, pool_size, breaker, **kwargs):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        super().__init__(timeout=timeout, session=session, **kwargs)
+        self.breaker = breaker
+
+    def request(self, method, url, headers, post_data=None):
+        if not self.breaker.allow_request():
+            metrics.incr(REJECTED)
+            raise StripeUnavailable('Stripe is unavailable right now (circuit open); try again shortly.')
+
+        started = time.monotonic()
+        metrics.incr(REQUESTS)
+        try:
+            response = super().request(method, url, headers, post_data)
+        except stripe.error.APIConnectionError:
+            self._record(started, failed=True)
+            raise
+        self._record(started, failed=response[1] >= 500)
+        return response
+
+    def _record(self, started, failed):
+        metrics.incr(LATENCY_MS, int((time.monotonic() - started) * 1000))
+        if failed:
+            metrics.incr(ERRORS)
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+
+def configure():
+    """Install the shared client and retry budget on the stripe module"""
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    # Point at a local stub server in development and tests
+    stripe.api_base = settings.STRIPE_API_BASE
+    stripe.max_network_retries = settings.STRIPE_MAX_NETWORK_RETRIES
+    stripe.default_http_client = PooledStripeClient(
+        timeout=(settings.STRIPE_CONNECT_TIMEOUT, settings.STRIPE_READ_TIMEOUT),
+        pool_size=settings.STRIPE_POOL_SIZE,
+        breaker=CircuitBreaker(
+            'stripe',
+            threshold=settings.STRIPE_BREAKER_THRESHOLD,
+            cooldown=settings.STRIPE_BREAKER_COOLDOWN,
+        ),
+    )
@@ -0,0 +1,741 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+import stripe
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.sessions.models import Session
+from django.db import connection, connections
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from main_app import metrics, routers, rowcounts, stripe_client
+from main_app.admin import CustomUserAdmin
+from main_app.middleware import REPLICA_PIN_COOKIE
+from main_app.utils import ensure_stripe_price, plan_price_lookup_key
+from main_app.models import (
+    DailyActivityTotal, EcoActivity, EcoActivityQuerySet, EmissionFactor, StripeEvent, SubscriptionPlan, SustainabilityGoal,
+    TableRowCount, UserSubscription,
+)
+
+
+class ChangelistQueryCountTestCase(TestCase):
+    """Admin changelists must run a fixed number of queries, however many rows they show"""
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.admin_user)
+        self.user_count = 0
+
+    def add_users(self, count, activities_per_user=2):
+        users = []
+        for _ in range(count):
+            self.user_count += 1
+            users.append(User.objects.create_user(f'member{self.user_count}', f'member{self.user_count}@example.com'))
+        EcoActivity.objects.bulk_create([
+            EcoActivity(
+                user=user, category='ENERGY', description='Test', value=1.5, unit='kwh',
+                date=date(2024, 1, 1), tags=f'{user.username},shared',
+            )
+            for user in users
+            for _ in range(activities_per_user)
+        ])
+        return users
+
+    def get_changelist(self, url, **params):
+        # Cold caches, so both requests take the same path
+        cache.clear()
+        response = self.client.get(url, params, secure=True)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def count_queries(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            self.get_changelist(url, **params)
+        return len(queries)
+
+
+class UserChangelistTests(ChangelistQueryCountTestCase):
+    def test_activity_counts_do_not_add_queries_per_row(self):
+        url = reverse('admin:auth_user_changelist')
+        self.add_users(5)
+        expected = self.count_queries(url)
+        self.add_users(25)
+        for per_page in (10, 31):
+            with self.subTest(per_page=per_page):
+                with mock.patch.object(CustomUserAdmin, 'list_per_page', per_page), self.assertNumQueries(expected):
+                    response = self.get_changelist(url)
+                self.assertEqual(len(response.context['cl'].result_list), per_page)
+
+    def test_activity_count_column(self):
+        user = self.add_users(1, activities_per_user=3)[0]
+        response = self.get_changelist(reverse('admin:auth_user_changelist'), q=user.username)
+        self.assertContains(response, '3 activities')
+
+
+class RegisteredChangelistTests(ChangelistQueryCountTestCase):
+    def add_rows(self, count):
+        """count more rows in the table behind every registered model admin"""
+        users = self.add_users(count)
+        plan = SubscriptionPlan.objects.create(name='Pro', price=15, billing_cycle='monthly', features='- Reports')
+        for user in users:
+            Group.objects.create(name=f'{user.username} group')
+            SustainabilityGoal.objects.create(
+                user=user, assigned_to=self.admin_user, title='Goal', description='Test', category='ENERGY',
+                unit='kwh', target_value=10, deadline=date(2024, 12, 31),
+            )
+            EmissionFactor.objects.create(category='ENERGY', unit=user.username, kg_co2e_per_unit=0.5)
+            SubscriptionPlan.objects.create(name=f'{user.username} plan', price=5, billing_cycle='yearly', features='- Tracking')
+            UserSubscription.objects.create(user=user, plan=plan, end_date=timezone.now() + timedelta(days=30))
+            StripeEvent.objects.create(event_id=f'evt_{user.username}', type='invoice.paid', payload={})
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.add_rows(3)
+        urls = {
+            model: reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+            for model in admin.site._registry
+        }
+        expected = {model: self.count_queries(url) for model, url in urls.items()}
+        before = {model: model._default_manager.count() for model in urls}
+        self.add_rows(20)
+        for model, url in urls.items():
+            with self.subTest(model=model._meta.label):
+                # A new model admin needs rows from add_rows to be covered here
+                self.assertGreater(model._default_manager.count(), before[model])
+                with self.assertNumQueries(expected[model]):
+                    self.get_changelist(url)
+
+
+class RowCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('member', 'member@example.com')
+
+    def add_activities(self, count):
+        EcoActivity.objects.bulk_create([
+            EcoActivity(user=self.user, category='ENERGY', description='Test', value=1, unit='kwh')
+            for _ in range(count)
+        ])
+
+    def test_counters_follow_the_triggers(self):
+        rowcounts.install_sqlite_counters()
+        self.add_activities(3)
+        self.assertEqual(rowcounts.estimate_row_count(EcoActivity), 3)
+
+        # Without triggers a counter would go stale, so it goes with them
+        rowcounts.remove_sqlite_counters()
+        self.assertFalse(TableRowCount.objects.exists())
+        self.assertIsNone(rowcounts.estimate_row_count(EcoActivity))
+
+        self.add_activities(2)
+        rowcounts.install_sqlite_counters()
+        self.assertEqual(rowcounts.estimate_row_count(EcoActivity), 5)
+        self.assertEqual(rowcounts.estimate_row_count(SustainabilityGoal), 0)
+
+
+class EmissionRollupTests(TestCase):
+    """DailyActivityTotal.co2e_kg must stay the sum of its activities' stored co2e_kg"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('member', 'member@example.com')
+
+    def add_activity(self, value, day=date(2024, 1, 1)):
+        return EcoActivity.objects.create(
+            user=self.user, category='ENERGY', description='Test', value=value, unit='kwh', date=day,
+        )
+
+    def set_factor(self, kg_co2e_per_unit):
+        factor = EmissionFactor.objects.get(category='ENERGY', unit='kwh')
+        factor.kg_co2e_per_unit = kg_co2e_per_unit
+        with self.captureOnCommitCallbacks(execute=True):
+            factor.save()
+
+    def assertRollupMatchesActivities(self):
+        # Raises CommandError on any drifted row
+        call_command('rebuild_activity_rollups', check=True, stdout=StringIO())
+        activities = EcoActivity.objects.aggregate(co2e_kg=Sum('co2e_kg'))['co2e_kg'] or 0.0
+        rollup = DailyActivityTotal.objects.aggregate(co2e_kg=Sum('co2e_kg'))['co2e_kg'] or 0.0
+        self.assertAlmostEqual(rollup, activities)
+
+    def test_old_activities_after_factor_change(self):
+        edited, deleted, updated, bulk_deleted = [self.add_activity(10) for _ in range(4)]
+        self.set_factor(0.5)
+        self.add_activity(10)
+
+        edited.value = 20
+        edited.save()
+        self.assertAlmostEqual(edited.co2e_kg, 10.0)
+        self.assertRollupMatchesActivities()
+
+        deleted.delete()
+        self.assertRollupMatchesActivities()
+
+        EcoActivity.objects.filter(pk=updated.pk).update(value=30)
+        self.assertRollupMatchesActivities()
+
+        EcoActivity.objects.filter(pk=bulk_deleted.pk).delete()
+        self.assertRollupMatchesActivities()
+
+        EcoActivity.objects.all().delete()
+        self.assertFalse(DailyActivityTotal.objects.exists())
+
+
+class GoalProgressTests(TestCase):
+    """Goals count activities in any spelling of their canonical unit, through every write path"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('member', 'member@example.com')
+        self.today = timezone.localdate()
+        self.kwh_goal = self.add_goal('kWh')
+        self.mwh_goal = self.add_goal('MWh')
+
+    def add_goal(self, unit, category='ENERGY'):
+        return SustainabilityGoal.objects.create(
+            user=self.user, title=f'Use less ({unit})', description='Test', target_value=1000, unit=unit,
+            category=category, created_at=timezone.now() - timedelta(days=10), deadline=self.today + timedelta(days=30),
+        )
+
+    def activity(self, value, unit='kwh', category='ENERGY'):
+        return EcoActivity(
+            user=self.user, category=category, description='Test', value=value, unit=unit, date=self.today,
+        )
+
+    def assertProgress(self, kwh, goal=None):
+        # Both raise CommandError on drift from the raw activities
+        call_command('rebuild_activity_rollups', check=True, stdout=StringIO())
+        call_command('reconcile_goal_progress', check=True, stdout=StringIO())
+        progress = dict(SustainabilityGoal.objects.values_list('pk', 'current_value'))
+        self.assertAlmostEqual(progress[self.kwh_goal.pk], kwh)
+        self.assertAlmostEqual(progress[self.mwh_goal.pk], kwh / 1000)
+
+    def test_unit_spelling_does_not_change_progress(self):
+        activity = self.activity(100)
+        activity.save()
+        self.assertProgress(100)
+
+        activity.unit = 'KWH'
+        activity.save()
+        self.assertProgress(100)
+
+        EcoActivity.objects.filter(pk=activity.pk).update(unit='k.W.h')
+        self.assertProgress(100)
+
+        activity.refresh_from_db()
+        activity.unit = 'Wh'
+        activity.save()
+        self.assertProgress(0.1)
+
+    def test_every_write_path_moves_progress(self):
+        saved, deleted = self.activity(100), self.activity(20, unit='KWH')
+        saved.save()
+        deleted.save()
+        self.assertProgress(120)
+
+        EcoActivity.objects.bulk_create([self.activity(3, unit='MWh'), self.activity(500, unit='wh')])
+        self.assertProgress(3120.5)
+
+        saved.value = 50
+        saved.save()
+        self.assertProgress(3070.5)
+
+        deleted.delete()
+        self.assertProgress(3050.5)
+
+        EcoActivity.objects.filter(unit='MWh').update(value=1)
+        self.assertProgress(1050.5)
+
+        EcoActivity.objects.filter(unit='wh').delete()
+        self.assertProgress(1050)
+
+        EcoActivity.objects.filter(pk=saved.pk).update(category='WATER')
+        self.assertProgress(1000)
+
+        EcoActivity.objects.all().delete()
+        self.assertProgress(0)
+
+    def test_goal_unit_change_recounts(self):
+        self.activity(2, unit='MWh').save()
+        self.kwh_goal.unit = 'MWh'
+        self.kwh_goal.save()
+        self.assertAlmostEqual(self.kwh_goal.current_value, 2)
+
+        SustainabilityGoal.objects.filter(pk=self.mwh_goal.pk).update(unit='kilowatt hours')
+        self.assertAlmostEqual(SustainabilityGoal.objects.get(pk=self.mwh_goal.pk).current_value, 2000)
+
+    def test_unrecognised_units_match_exactly(self):
+        trips = self.add_goal('trips', category='TRANSPORT')
+        self.activity(4, unit='trips', category='TRANSPORT').save()
+        self.activity(5, unit='Trips', category='TRANSPORT').save()
+        self.activity(6, unit='km', category='TRANSPORT').save()
+        call_command('reconcile_goal_progress', check=True, stdout=StringIO())
+        self.assertAlmostEqual(SustainabilityGoal.objects.get(pk=trips.pk).current_value, 4)
+
+
+class DashboardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('member', 'member@example.com')
+        self.client.force_login(self.user)
+        EcoActivity.objects.create(
+            user=self.user, category='ENERGY', description='Test', value=10, unit='kwh', date=date(2024, 1, 31),
+        )
+
+    def monthly_categories(self, now):
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            response = self.client.get(reverse('main_app:dashboard'), secure=True)
+        return [row['category'] for row in response.context['monthly_stats']]
+
+    def test_new_month_is_not_served_from_cache(self):
+        self.assertEqual(self.monthly_categories(datetime(2024, 1, 31, 23, 58, tzinfo=dt_timezone.utc)), ['ENERGY'])
+        self.assertEqual(self.monthly_categories(datetime(2024, 2, 1, 0, 2, tzinfo=dt_timezone.utc)), [])
+
+
+class ImportActivitiesTests(TestCase):
+    def setUp(self):
+        User.objects.create_user('member', 'member@example.com')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'activities.jsonl')
+        with open(self.path, 'w') as fh:
+            for n in range(8):
+                # Every other row has a negative value and is rejected
+                value = n if n % 2 == 0 else -n
+                fh.write(json.dumps({
+                    'user': 'member', 'category': 'ENERGY', 'description': f'Row {n}',
+                    'value': value, 'unit': 'kwh', 'date': '2024-01-01',
+                }) + '\n')
+
+    def import_activities(self, **options):
+        call_command('import_activities', self.path, batch_size=2, stdout=StringIO(), **options)
+
+    def rejected_rows(self):
+        with open(f'{self.path}.errors.jsonl') as fh:
+            return [json.loads(line)['row']['description'] for line in fh]
+
+    def test_resume_records_each_rejected_row_once(self):
+        bulk_create = EcoActivityQuerySet.bulk_create
+        calls = []
+
+        def dies_on_second_batch(queryset, objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return bulk_create(queryset, objs, *args, **kwargs)
+
+        with mock.patch.object(EcoActivityQuerySet, 'bulk_create', dies_on_second_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                self.import_activities()
+        # The second batch's rejected row was written before the run died
+        self.assertEqual(self.rejected_rows(), ['Row 1', 'Row 3'])
+
+        self.import_activities(resume=True)
+        self.assertEqual(self.rejected_rows(), ['Row 1', 'Row 3', 'Row 5', 'Row 7'])
+        self.assertEqual(EcoActivity.objects.count(), 4)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Reads on a second connection to the test database, standing in for a replica"""
+    serialized_rollback = True
+
+    def setUp(self):
+        replica = mock.patch.dict(settings.DATABASES, {routers.REPLICA: dict(connections['default'].settings_dict)})
+        replica.start()
+        self.addCleanup(replica.stop)
+        self.addCleanup(self.close_replica)
+        self.user = User.objects.create_user('member', 'member@example.com')
+        EcoActivity.objects.create(
+            user=self.user, category='ENERGY', description='Test', value=1.5, unit='kwh', date=date(2024, 1, 1),
+        )
+        self.client.force_login(self.user)
+
+    def close_replica(self):
+        connections[routers.REPLICA].close()
+        del connections[routers.REPLICA]
+
+    def queries_by_alias(self, request):
+        """({alias: SQL run on it}, response) for one request"""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[routers.REPLICA]) as replica:
+            response = request()
+        return {'default': primary.captured_queries, 'replica': replica.captured_queries}, response
+
+    def assertReadsActivitiesFrom(self, alias, queries):
+        other = 'default' if alias == routers.REPLICA else routers.REPLICA
+        self.assertTrue(any('main_app_ecoactivity' in query['sql'] for query in queries[alias]))
+        self.assertFalse(any('main_app_ecoactivity' in query['sql'] for query in queries[other]))
+
+    def list_activities(self):
+        return self.client.get('/api/activities/', secure=True)
+
+    def test_get_without_pin_reads_from_replica(self):
+        queries, response = self.queries_by_alias(self.list_activities)
+        self.assertEqual(response.status_code, 200)
+        self.assertReadsActivitiesFrom(routers.REPLICA, queries)
+        # The session and the logged-in user always come from the primary
+        self.assertFalse(any('django_session' in query['sql'] for query in queries[routers.REPLICA]))
+        self.assertFalse(any('auth_user' in query['sql'] for query in queries[routers.REPLICA]))
+
+    def test_write_pins_later_reads_to_primary(self):
+        response = self.client.post(
+            '/api/activities/',
+            data={'category': 'ENERGY', 'description': 'New', 'value': 2, 'unit': 'kwh', 'date': '2024-01-02'},
+            content_type='application/json',
+            secure=True,
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+
+        queries, response = self.queries_by_alias(self.list_activities)
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertReadsActivitiesFrom('default', queries)
+
+        del self.client.cookies[REPLICA_PIN_COOKIE]
+        queries, _ = self.queries_by_alias(self.list_activities)
+        self.assertReadsActivitiesFrom(routers.REPLICA, queries)
+
+    def test_primary_only_models(self):
+        plan = SubscriptionPlan.objects.create(name='Pro', price=15, billing_cycle='monthly', features='- Reports')
+        UserSubscription.objects.create(user=self.user, plan=plan, end_date=timezone.now() + timedelta(days=30))
+        StripeEvent.objects.create(event_id='evt_1', type='invoice.paid', payload={})
+        router = routers.ReplicaRouter()
+        with routers.replica_reads():
+            for model in (Session, User, UserSubscription, StripeEvent):
+                with self.subTest(model=model._meta.label):
+                    self.assertEqual(router.db_for_read(model), 'default')
+                    with self.assertNumQueries(0, using=routers.REPLICA), self.assertNumQueries(1):
+                        self.assertTrue(model.objects.exists())
+            self.assertEqual(router.db_for_read(EcoActivity), routers.REPLICA)
+
+
+def start_stub_server(handler):
+    """Serve `handler` on a free local port from a background thread; returns the server"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    # server_close() waits for handlers still sleeping after a client timed out
+    server.daemon_threads = False
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_stub_server(server):
+    server.shutdown()
+    server.server_close()
+
+
+class StubStripeHandler(BaseHTTPRequestHandler):
+    """/slow outlasts the client's read timeout, /probe is slow but in time, /error answers 500"""
+    delays = {'/slow': 1.0, '/probe': 0.2}
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        time.sleep(self.delays.get(self.path, 0))
+        body = b'{}'
+        try:
+            self.send_response(500 if self.path == '/error' else 200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out and hung up
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class StripeClientTests(SimpleTestCase):
+    THRESHOLD = 3
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub_server(StubStripeHandler)
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_stub_server(cls.server)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.hits = []
+        self.breaker = stripe_client.CircuitBreaker('test', threshold=self.THRESHOLD, cooldown=30)
+        self.client = stripe_client.PooledStripeClient(timeout=(1, 0.5), pool_size=5, breaker=self.breaker)
+
+    def call(self, path):
+        return self.client.request('get', f'http://127.0.0.1:{self.server.server_port}{path}', {})
+
+    def open_breaker(self):
+        for _ in range(self.THRESHOLD):
+            self.call('/error')
+
+    def end_cooldown(self):
+        # What the open key expiring after `cooldown` seconds does
+        cache.delete(self.breaker.open_key)
+
+    def counters(self):
+        return metrics.snapshot([
+            stripe_client.REQUESTS, stripe_client.ERRORS, stripe_client.REJECTED, stripe_client.CIRCUIT_OPENED,
+        ])
+
+    def test_read_timeout_raises(self):
+        started = time.monotonic()
+        with self.assertRaises(stripe.error.APIConnectionError) as raised:
+            self.call('/slow')
+        self.assertNotIsInstance(raised.exception, stripe_client.StripeUnavailable)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(self.counters()[stripe_client.ERRORS], 1)
+
+    def test_opens_after_threshold_failures(self):
+        for _ in range(self.THRESHOLD - 1):
+            self.call('/error')
+        self.assertEqual(self.call('/ok')[1], 200)
+        # A success resets the count
+        for _ in range(self.THRESHOLD - 1):
+            self.call('/error')
+        self.assertEqual(self.call('/ok')[1], 200)
+
+        self.open_breaker()
+        hits = len(self.server.hits)
+        with self.assertRaises(stripe_client.StripeUnavailable):
+            self.call('/ok')
+        self.assertEqual(len(self.server.hits), hits)
+        self.assertEqual(self.counters(), {
+            stripe_client.REQUESTS: 2 * (self.THRESHOLD - 1) + 2 + self.THRESHOLD,
+            stripe_client.ERRORS: 2 * (self.THRESHOLD - 1) + self.THRESHOLD,
+            stripe_client.REJECTED: 1,
+            stripe_client.CIRCUIT_OPENED: 1,
+        })
+
+    def test_half_open_lets_one_probe_through_then_closes(self):
+        self.open_breaker()
+        self.end_cooldown()
+        self.server.hits = []
+        barrier = threading.Barrier(5)
+        outcomes = []
+
+        def probe():
+            barrier.wait()
+            try:
+                outcomes.append(self.call('/probe')[1])
+            except stripe_client.StripeUnavailable:
+                outcomes.append('rejected')
+
+        threads = [threading.Thread(target=probe) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.server.hits, ['/probe'])
+        self.assertEqual(sorted(outcomes, key=str), [200] + ['rejected'] * 4)
+
+        # The probe succeeded, so the breaker is closed for everyone
+        self.assertEqual([self.call('/ok')[1] for _ in range(3)], [200] * 3)
+        self.assertEqual(self.counters()[stripe_client.REJECTED], 4)
+
+    def test_failed_probe_reopens(self):
+        self.open_breaker()
+        self.end_cooldown()
+        self.call('/error')
+        with self.assertRaises(stripe_client.StripeUnavailable):
+            self.call('/ok')
+        self.assertEqual(self.counters()[stripe_client.CIRCUIT_OPENED], 2)
+
+
+class EnsureStripePriceTests(TestCase):
+    def setUp(self):
+        self.plan = SubscriptionPlan.objects.create(
+            name='Pro', price=15, billing_cycle='yearly', features='- Reports',
+        )
+        self.price_ids = iter(f'price_{n}' for n in range(1, 100))
+        patches = {
+            'list': mock.patch.object(stripe.Price, 'list', return_value=SimpleNamespace(data=[])),
+            'price': mock.patch.object(
+                stripe.Price, 'create', side_effect=lambda **kwargs: SimpleNamespace(id=next(self.price_ids)),
+            ),
+            'product': mock.patch.object(stripe.Product, 'create', return_value=SimpleNamespace(id='prod_1')),
+        }
+        self.stripe = {name: patch.start() for name, patch in patches.items()}
+        for patch in patches.values():
+            self.addCleanup(patch.stop)
+
+    def reload(self):
+        return SubscriptionPlan.objects.get(pk=self.plan.pk)
+
+    def test_first_checkout_creates_price_once(self):
+        lookup_key = plan_price_lookup_key(self.plan)
+        self.assertEqual(ensure_stripe_price(self.plan), 'price_1')
+        self.stripe['product'].assert_called_once()
+        self.stripe['price'].assert_called_once_with(
+            product='prod_1', unit_amount=1500, currency='usd', recurring={'interval': 'year'},
+            lookup_key=lookup_key, idempotency_key=lookup_key,
+        )
+        self.assertEqual(self.stripe['product'].call_args.kwargs['idempotency_key'], f'ecotrack-plan-{self.plan.pk}-product')
+        plan = self.reload()
+        self.assertEqual((plan.stripe_price_id, plan.stripe_product_id), ('price_1', 'prod_1'))
+
+    def test_later_checkouts_reuse_stored_price(self):
+        ensure_stripe_price(self.plan)
+        for stripe_call in self.stripe.values():
+            stripe_call.reset_mock()
+        self.assertEqual(ensure_stripe_price(self.reload()), 'price_1')
+        with self.assertNumQueries(0):
+            self.assertEqual(ensure_stripe_price(self.plan), 'price_1')
+        for stripe_call in self.stripe.values():
+            stripe_call.assert_not_called()
+
+    def test_existing_lookup_key_is_recovered(self):
+        self.stripe['list'].return_value = SimpleNamespace(data=[SimpleNamespace(id='price_lost', product='prod_lost')])
+        self.assertEqual(ensure_stripe_price(self.plan), 'price_lost')
+        self.stripe['price'].assert_not_called()
+        self.assertEqual(self.reload().stripe_product_id, 'prod_lost')
+
+    def test_price_or_cycle_change_clears_price(self):
+        for field, value in (('price', 20), ('billing_cycle', 'monthly')):
+            with self.subTest(field=field):
+                ensure_stripe_price(self.reload())
+                plan = self.reload()
+                setattr(plan, field, value)
+                plan.save()
+                self.assertIsNone(self.reload().stripe_price_id)
+        self.assertEqual(ensure_stripe_price(self.reload()), 'price_3')
+        self.assertEqual(self.stripe['price'].call_args.kwargs['recurring'], {'interval': 'month'})
+        self.assertEqual(self.stripe['price'].call_args.kwargs['unit_amount'], 2000)
+
+    def test_racing_checkouts_store_one_price(self):
+        racing_plan = self.reload()
+        results = []
+
+        def create_price(**kwargs):
+            price_id = next(self.price_ids)
+            if price_id == 'price_1':
+                # A second checkout runs start to finish while the first waits on Stripe
+                results.append(ensure_stripe_price(racing_plan))
+            return SimpleNamespace(id=price_id)
+
+        self.stripe['price'].side_effect = create_price
+        results.append(ensure_stripe_price(self.plan))
+        self.assertEqual(results, ['price_2', 'price_2'])
+        self.assertEqual(self.reload().stripe_price_id, 'price_2')
+
+
+class StubSubscriptionListHandler(BaseHTTPRequestHandler):
+    """Stripe's GET /v1/subscriptions: server.subscriptions, server.page_size at a time, paged by starting_after"""
+
+    def do_GET(self):
+        params = parse_qs(urlsplit(self.path).query)
+        self.server.hits.append(params)
+        subscriptions = self.server.subscriptions
+        start = 0
+        if 'starting_after' in params:
+            start = [s['id'] for s in subscriptions].index(params['starting_after'][0]) + 1
+        page = subscriptions[start:start + self.server.page_size]
+        body = json.dumps({
+            'object': 'list',
+            'url': '/v1/subscriptions',
+            'has_more': start + len(page) < len(subscriptions),
+            'data': page,
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SyncSubscriptionsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub_server(StubSubscriptionListHandler)
+        cls.server.page_size = 2
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_stub_server(cls.server)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.hits = []
+        self.server.subscriptions = []
+        for name, value in (
+            ('api_base', f'http://127.0.0.1:{self.server.server_port}'),
+            ('api_key', 'sk_test_stub'),
+            ('max_network_retries', 0),
+        ):
+            patch = mock.patch.object(stripe, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.plan = SubscriptionPlan.objects.create(name='Pro', price=15, billing_cycle='monthly', features='')
+        self.period_end = timezone.now().replace(microsecond=0) + timedelta(days=20)
+
+    def local(self, name, stripe_id, end_date=None):
+        user = User.objects.create_user(name, f'{name}@example.com', 'password')
+        return UserSubscription.objects.create(
+            user=user, plan=self.plan, end_date=end_date or self.period_end, stripe_subscription_id=stripe_id,
+        )
+
+    def upstream(self, stripe_id, status='active', end_date=None):
+        self.server.subscriptions.append({
+            'id': stripe_id,
+            'object': 'subscription',
+            'status': status,
+            'current_period_end': int((end_date or self.period_end).timestamp()),
+        })
+
+    def test_sync_pages_through_stripe_and_updates_only_what_changed(self):
+        unchanged = self.local('unchanged', 'sub_unchanged')
+        renewed = self.local('renewed', 'sub_renewed', end_date=timezone.now() + timedelta(days=1))
+        canceled = self.local('canceled', 'sub_canceled')
+        missing = self.local('missing', 'sub_missing')
+        local_only = self.local('local_only', None)
+        self.upstream('sub_unchanged')
+        self.upstream('sub_renewed', end_date=self.period_end + timedelta(days=30))
+        self.upstream('sub_canceled', status='canceled')
+        self.upstream('sub_elsewhere_1')
+        self.upstream('sub_elsewhere_2')
+
+        bulk_update = mock.patch.object(
+            UserSubscription.objects, 'bulk_update', wraps=UserSubscription.objects.bulk_update,
+        )
+        out = StringIO()
+        with bulk_update as spy:
+            call_command('sync_subscriptions', batch_size=2, stdout=out)
+
+        # Five subscriptions two to a page: three requests, each after the last id seen
+        self.assertEqual(
+            [params.get('starting_after') for params in self.server.hits],
+            [None, ['sub_renewed'], ['sub_elsewhere_1']],
+        )
+        self.assertIn('Compared 5 Stripe subscriptions, updated 2 local rows, deactivated 1 missing from Stripe', out.getvalue())
+        updated = [row.pk for call in spy.call_args_list for row in call.args[0]]
+        self.assertCountEqual(updated, [renewed.pk, canceled.pk])
+
+        rows = UserSubscription.objects.in_bulk()
+        self.assertEqual((rows[unchanged.pk].is_active, rows[unchanged.pk].end_date), (True, self.period_end))
+        self.assertEqual(rows[renewed.pk].end_date, self.period_end + timedelta(days=30))
+        self.assertTrue(rows[renewed.pk].is_active)
+        self.assertFalse(rows[canceled.pk].is_active)
+        self.assertFalse(rows[missing.pk].is_active)
+        self.assertTrue(rows[local_only.pk].is_active)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, api
 
 app_name = 'main_app'
 
@@ -9,7 +9,19 @@ urlpatterns = [
     path('activity/add/', views.add_activity, name='add_activity'),
     path('goals/add/', views.add_goal, name='add_goal'),
     path('pricing/', views.pricing, name='pricing'),
+    path('search/', views.search_activities, name='search'),
+
+    # Export URLs
+    path('export/activities/', views.export_activities, name='export_activities'),
+    path('export/goals/', views.export_goals, name='export_goals'),
     
+    # JSON API URLs
+    path('api/activities/', api.activity_list, name='api_activity_list'),
+    path('api/activities/batch/', api.activity_batch_create, name='api_activity_batch_create'),
+    path('api/activities/<int:pk>/', api.activity_detail, name='api_activity_detail'),
+    path('api/tags/', api.tag_list, name='api_tag_list'),
+    path('api/analytics/series/', api.activity_series, name='api_activity_series'),
+
     # Subscription URLs
     path('checkout/session/<int:plan_id>/', views.create_checkout_session, name='create_checkout_session'),
     path('subscription/success/', views.subscription_success, name='subscription_success'),
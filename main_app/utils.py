@@ -1,10 +1,72 @@
 import stripe
 from django.conf import settings
+from django.db.models import Q
 from django.urls import reverse
 from datetime import datetime, timedelta
 
 stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', '')
 
+# SubscriptionPlan.billing_cycle -> Stripe recurring interval
+STRIPE_INTERVALS = {
+    'monthly': 'month',
+    'yearly': 'year',
+}
+
+def plan_price_lookup_key(plan):
+    """Stripe lookup key identifying one plan at one price and interval"""
+    return f'ecotrack-plan-{plan.pk}-{int(plan.price * 100)}-{STRIPE_INTERVALS[plan.billing_cycle]}'
+
+def ensure_stripe_price(plan):
+    """
+    Return the Stripe Price id for a plan, creating the Product and Price the first time.
+
+    The id is stored on the plan, so later checkouts make no extra API calls.
+    Stripe is called outside any transaction or row lock: idempotency keys make
+    concurrent first checkouts get the same Product and Price, and a conditional
+    UPDATE stores the id only if no other checkout (or price change) got there
+    first. The Price's lookup key lets a lost database write be recovered from Stripe.
+    """
+    if plan.stripe_price_id:
+        return plan.stripe_price_id
+
+    from .caching import invalidate_plans
+    from .models import SubscriptionPlan
+    current = SubscriptionPlan.objects.get(pk=plan.pk)
+    if not current.stripe_price_id:
+        lookup_key = plan_price_lookup_key(current)
+        existing = stripe.Price.list(lookup_keys=[lookup_key], limit=1).data
+        if existing:
+            price = existing[0]
+            product_id = current.stripe_product_id or price.product
+        else:
+            product_id = current.stripe_product_id
+            if not product_id:
+                product_id = stripe.Product.create(
+                    name=current.name,
+                    description=current.features,
+                    idempotency_key=f'ecotrack-plan-{current.pk}-product',
+                ).id
+            price = stripe.Price.create(
+                product=product_id,
+                unit_amount=int(current.price * 100),  # Convert to cents
+                currency='usd',
+                recurring={'interval': STRIPE_INTERVALS[current.billing_cycle]},
+                lookup_key=lookup_key,
+                idempotency_key=lookup_key,
+            )
+        stored = SubscriptionPlan.objects.filter(
+            Q(stripe_price_id__isnull=True) | Q(stripe_price_id=''),
+            pk=current.pk, price=current.price, billing_cycle=current.billing_cycle,
+        ).update(stripe_price_id=price.id, stripe_product_id=product_id)
+        if not stored:
+            # Another checkout stored its Price first, or the plan's price changed meanwhile
+            return ensure_stripe_price(plan)
+        invalidate_plans()
+        current.stripe_price_id, current.stripe_product_id = price.id, product_id
+    plan.stripe_price_id = current.stripe_price_id
+    plan.stripe_product_id = current.stripe_product_id
+    return plan.stripe_price_id
+
 def create_stripe_checkout_session(request, plan):
     """Create a Stripe Checkout Session for subscription"""
     if not stripe.api_key:
@@ -17,26 +79,11 @@ def create_stripe_checkout_session(request, plan):
         reverse('main_app:pricing')
     )
     
-    # Create or get Stripe Product and Price
-    stripe_product = stripe.Product.create(
-        name=plan.name,
-        description=plan.features
-    )
-    
-    stripe_price = stripe.Price.create(
-        product=stripe_product.id,
-        unit_amount=int(plan.price * 100),  # Convert to cents
-        currency='usd',
-        recurring={
-            'interval': plan.billing_cycle
-        }
-    )
-    
-    # Create Checkout Session
+    # Checkout Session (the plan's Price is created only on its first checkout)
     checkout_session = stripe.checkout.Session.create(
         payment_method_types=['card'],
         line_items=[{
-            'price': stripe_price.id,
+            'price': ensure_stripe_price(plan),
             'quantity': 1,
         }],
         mode='subscription',
@@ -94,3 +141,14 @@ def handle_subscription_deleted(event):
         user_sub.save()
     except UserSubscription.DoesNotExist:
         pass
+
+EVENT_HANDLERS = {
+    'customer.subscription.created': handle_subscription_created,
+    'customer.subscription.deleted': handle_subscription_deleted,
+}
+
+def process_stripe_event(stripe_event):
+    """Run the handler for a stored StripeEvent; types without a handler are simply acknowledged"""
+    handler = EVENT_HANDLERS.get(stripe_event.type)
+    if handler:
+        handler(stripe.Event.construct_from(stripe_event.payload, stripe.api_key))
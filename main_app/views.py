@@ -1,16 +1,20 @@
+import json
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum
 from django.utils import timezone
-from .models import EcoActivity, SustainabilityGoal, SubscriptionPlan
+from .models import EcoActivity, SustainabilityGoal, SubscriptionPlan, DailyActivityTotal, StripeEvent
 from .forms import EcoActivityForm, SustainabilityGoalForm, UserRegistrationForm
 import stripe
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
-from .utils import create_stripe_checkout_session, handle_subscription_created, handle_subscription_deleted
+from .utils import create_stripe_checkout_session
+from django.contrib.messages.storage.cookie import CookieStorage
+from .caching import get_active_plans, get_dashboard_context, get_pricing_page
+from . import exports, search
+from .routers import use_replica
 
 stripe.api_key = getattr(settings, 'STRIPE_SECRET_KEY', '')
 
@@ -29,35 +33,38 @@ def register(request):
         form = UserRegistrationForm()
     return render(request, 'main_app/register.html', {'form': form})
 
-@login_required
-def dashboard(request):
+def build_dashboard_context(user):
+    """Evaluate the dashboard queries into plain lists so they can be cached"""
     # Get recent activities
-    recent_activities = EcoActivity.objects.filter(
-        user=request.user
-    ).order_by('-date')[:5]
+    recent_activities = list(EcoActivity.objects.filter(
+        user=user
+    ).order_by('-date')[:5])
 
     # Get active goals
-    active_goals = SustainabilityGoal.objects.filter(
-        user=request.user,
+    active_goals = list(SustainabilityGoal.objects.filter(
+        user=user,
         status__in=['PENDING', 'IN_PROGRESS']
-    ).order_by('deadline')
+    ).order_by('deadline'))
 
     # Calculate summary statistics
-    today = timezone.now().date()
+    today = timezone.localdate()
     month_start = today.replace(day=1)
-    
-    monthly_stats = EcoActivity.objects.filter(
-        user=request.user,
-        date__gte=month_start
-    ).values('category').annotate(
-        total=Sum('value')
-    )
 
-    context = {
+    monthly_stats = list(DailyActivityTotal.objects.for_period(
+        user, start=month_start
+    ).category_totals())
+
+    return {
         'recent_activities': recent_activities,
         'active_goals': active_goals,
         'monthly_stats': monthly_stats,
     }
+
+@login_required
+def dashboard(request):
+    context = get_dashboard_context(
+        request.user.pk, lambda: build_dashboard_context(request.user)
+    )
     return render(request, 'main_app/dashboard.html', context)
 
 @login_required
@@ -90,6 +97,61 @@ def add_goal(request):
     
     return render(request, 'main_app/goal_form.html', {'form': form})
 
+@use_replica
+@login_required
+def search_activities(request):
+    """Ranked full-text search over the user's activities"""
+    query = request.GET.get('q', '').strip()
+    results = search.ranked_activities(request.user, query) if query else []
+    return render(request, 'main_app/search.html', {'query': query, 'results': results})
+
+def _streaming_export(request, queryset, fields, basename):
+    """Stream a queryset as CSV or JSONL (?format=), optionally gzipped (?gzip=1)"""
+    # Pin the database now: the stream is consumed after the view (and its routing) has returned
+    queryset = queryset.using(queryset.db)
+    export_format = request.GET.get('format', 'csv')
+    if export_format == 'csv':
+        lines = exports.csv_lines(queryset, fields)
+        content_type = 'text/csv'
+    elif export_format == 'jsonl':
+        lines = exports.jsonl_lines(queryset, fields)
+        content_type = 'application/x-ndjson'
+    else:
+        return HttpResponseBadRequest('format must be csv or jsonl')
+
+    stream = exports.encode_stream(lines)
+    filename = f'{basename}.{export_format}'
+    if request.GET.get('gzip') in ('1', 'true'):
+        stream = exports.gzip_stream(stream)
+        content_type = 'application/gzip'
+        filename += '.gz'
+
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@use_replica
+@login_required
+def export_activities(request):
+    """Stream the user's activity history"""
+    queryset = EcoActivity.objects.filter(user=request.user).order_by('date', 'id')
+    try:
+        queryset = exports.filter_activities(queryset, request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return _streaming_export(request, queryset, exports.ACTIVITY_FIELDS, 'activities')
+
+@use_replica
+@login_required
+def export_goals(request):
+    """Stream the user's goal history"""
+    queryset = SustainabilityGoal.objects.filter(user=request.user).order_by('deadline', 'id')
+    try:
+        queryset = exports.filter_goals(queryset, request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return _streaming_export(request, queryset, exports.GOAL_FIELDS, 'goals')
+
 @login_required
 def create_checkout_session(request, plan_id):
     """Create a Stripe Checkout Session for subscription"""
@@ -97,6 +159,8 @@ def create_checkout_session(request, plan_id):
         plan = SubscriptionPlan.objects.get(id=plan_id, is_active=True)
         checkout_session = create_stripe_checkout_session(request, plan)
         return JsonResponse({'sessionId': checkout_session.id})
+    except stripe.error.APIConnectionError:
+        return JsonResponse({'error': 'Payments are temporarily unavailable, please try again shortly.'}, status=503)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
@@ -128,7 +192,7 @@ def cancel_subscription(request):
 
 @csrf_exempt
 def stripe_webhook(request):
-    """Handle Stripe webhooks"""
+    """Verify a Stripe webhook and queue it for process_stripe_events"""
     payload = request.body
     sig_header = request.META.get('HTTP_STRIPE_SIGNATURE')
 
@@ -141,107 +205,29 @@ def stripe_webhook(request):
     except stripe.error.SignatureVerificationError as e:
         return HttpResponse(status=400)
 
-    if event.type == 'customer.subscription.created':
-        handle_subscription_created(event)
-    elif event.type == 'customer.subscription.deleted':
-        handle_subscription_deleted(event)
-
+    # Store and acknowledge; process_stripe_events does the work. A redelivered
+    # event hits the unique event_id and is dropped by the same INSERT.
+    StripeEvent.objects.bulk_create(
+        [StripeEvent(event_id=event.id, type=event.type, payload=json.loads(payload))],
+        ignore_conflicts=True,
+    )
     return HttpResponse(status=200)
 
+def _is_anonymous_visit(request):
+    """No session and no pending messages: the page is the same for every such visitor"""
+    return not (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        or request.COOKIES.get(CookieStorage.cookie_name)
+    )
+
 def pricing(request):
-    """Display pricing plans"""
-    try:
-        # Get all active plans
-        plans = list(SubscriptionPlan.objects.filter(is_active=True).order_by('price'))
-        print(f"Initial plans count: {len(plans)}")  # Debug print
-        
-        # Create default plans if none exist
-        if not plans:
-            print("No plans found, creating defaults...")  # Debug print
-            default_plans = [
-                {
-                    'name': 'Community',
-                    'price': 0.00,
-                    'billing_cycle': 'monthly',
-                    'features': '''
-                        - Basic activity tracking
-                        - Simple goal setting
-                        - Community support
-                        - Basic reporting
-                    '''
-                },
-                {
-                    'name': 'Professional',
-                    'price': 29.00,
-                    'billing_cycle': 'monthly',
-                    'features': '''
-                        - Advanced activity tracking
-                        - Detailed goal analytics
-                        - Priority support
-                        - Custom reporting
-                        - Team collaboration
-                    '''
-                },
-                {
-                    'name': 'Enterprise',
-                    'price': 99.00,
-                    'billing_cycle': 'monthly',
-                    'features': '''
-                        - All Professional features
-                        - Enterprise-grade support
-                        - Custom integrations
-                        - Advanced analytics
-                        - Dedicated account manager
-                        - Custom branding
-                    '''
-                }
-            ]
-            
-            for plan_data in default_plans:
-                try:
-                    # Check if plan already exists
-                    plan = SubscriptionPlan.objects.filter(name=plan_data['name']).first()
-                    if not plan:
-                        print(f"Creating plan: {plan_data['name']}")  # Debug print
-                        plan = SubscriptionPlan.objects.create(
-                            name=plan_data['name'],
-                            price=plan_data['price'],
-                            billing_cycle=plan_data['billing_cycle'],
-                            features=plan_data['features'],
-                            is_active=True
-                        )
-                        print(f"Created plan: {plan.name}")  # Debug print
-                except Exception as e:
-                    print(f"Error creating plan {plan_data['name']}: {str(e)}")  # Debug print
-            
-            # Get all plans again after creation
-            plans = list(SubscriptionPlan.objects.filter(is_active=True).order_by('price'))
-            print(f"Plans after creation: {len(plans)}")  # Debug print
-        
-        # Convert features text to list for each plan
-        for plan in plans:
-            print(f"Processing plan: {plan.name}")  # Debug print
-            features = []
-            for feature in plan.features.strip().split('\n'):
-                feature = feature.strip('- ').strip()
-                if feature:  # Only add non-empty features
-                    features.append(feature)
-            plan.feature_list = features
-            print(f"Features for {plan.name}: {len(features)}")  # Debug print
-        
-        context = {
-            'plans': plans,
-            'stripe_publishable_key': getattr(settings, 'STRIPE_PUBLISHABLE_KEY', '')
-        }
-        
-        return render(request, 'main_app/pricing.html', context)
-    
-    except Exception as e:
-        print(f"Error in pricing view: {str(e)}")  # Debug print
-        import traceback
-        print(traceback.format_exc())  # Print full traceback
-        # Return an error message to the user
+    """Display pricing plans; anonymous visitors get a cached copy of the whole page"""
+    def render_page():
         return render(request, 'main_app/pricing.html', {
-            'plans': [],
-            'error_message': f'An error occurred while loading the pricing plans: {str(e)}'
+            'plans': get_active_plans(),
+            'stripe_publishable_key': getattr(settings, 'STRIPE_PUBLISHABLE_KEY', ''),
         })
+
+    if _is_anonymous_visit(request):
+        return HttpResponse(get_pricing_page(lambda: render_page().content))
+    return render_page()